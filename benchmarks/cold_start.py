@@ -0,0 +1,62 @@
+"""
+Холодный старт воркера: время загрузки WSGI-приложения (импорт projectWeb.wsgi вместе
+с URL-конфигурацией), время до первого ответа и RSS процесса после загрузки. Каждый замер —
+отдельный процесс; сравниваются режимы с документацией API и без неё (API_DOCS_ENABLED).
+
+    python benchmarks/cold_start.py --runs 5 --path /metrics
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from utils import BASE_DIR
+
+CHILD = r'''
+import io, json, resource, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {base_dir!r})
+from projectWeb.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns  # URL-конфигурация загружается при первом запросе — учитываем её в загрузке
+booted = time.perf_counter()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+environ = {{'REQUEST_METHOD': 'GET', 'PATH_INFO': {path!r}, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+           'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO()}}
+response = application(environ, lambda status, headers: None)
+b''.join(response)
+response.close()
+print(json.dumps({{'boot': booted - started, 'first': time.perf_counter() - started, 'rss_kb': rss,
+                  'modules': len(sys.modules)}}))
+'''
+
+
+def run(path, docs):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='projectWeb.settings', API_DOCS_ENABLED='1' if docs else '0')
+    output = subprocess.run([sys.executable, '-c', CHILD.format(base_dir=str(BASE_DIR), path=path)],
+                            env=env, cwd=BASE_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/metrics', help='Первый запрос (по умолчанию без обращения к БД)')
+    args = parser.parse_args()
+
+    for label, docs in (('docs on', True), ('docs off', False)):
+        results = [run(args.path, docs) for _ in range(args.runs)]
+        # ru_maxrss в Linux — в килобайтах
+        print(f"{label:>8}: boot {median([r['boot'] for r in results]) * 1000:7.1f} ms  "
+              f"first request {median([r['first'] for r in results]) * 1000:7.1f} ms  "
+              f"RSS {median([r['rss_kb'] for r in results]) / 1024:6.1f} MB  "
+              f"modules {median([r['modules'] for r in results])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Нагрузочное сравнение синхронных эндпоинтов под WSGI (gunicorn) и асинхронных (/api/async/...)
+под ASGI (uvicorn): запросы в секунду и p50/p99 задержки.
+
+    python benchmarks/load_test.py --concurrency 32 --duration 10
+    python benchmarks/load_test.py --mode asgi --base-url http://127.0.0.1:8001  # уже запущенный сервер
+
+Серверы работают с базой из настроек проекта и только читают её. Асинхронные эндпоинты
+не кэшируются, поэтому серверы запускаются с RESPONSE_CACHE_ENABLED=0: обе стороны каждый раз
+идут в БД, и сравнивается модель исполнения, а не кэш. Уже запущенный сервер (--base-url)
+для честного сравнения тоже нужно запустить с RESPONSE_CACHE_ENABLED=0.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from utils import BASE_DIR
+
+ENDPOINTS = {
+    'wsgi': ['/api/blog/', '/api/gyms/', '/api/schedule/weekly/'],
+    'asgi': ['/api/async/blog/', '/api/async/gyms/', '/api/async/schedule/weekly/'],
+}
+
+SERVERS = {
+    'wsgi': lambda port, workers: ['gunicorn', 'projectWeb.wsgi:application', '--bind', f'127.0.0.1:{port}',
+                                   '--workers', str(workers), '--threads', '4'],
+    'asgi': lambda port, workers: ['uvicorn', 'projectWeb.asgi:application', '--port', str(port),
+                                   '--workers', str(workers), '--log-level', 'warning'],
+}
+
+
+def check_servers(modes):
+    # gunicorn и uvicorn не входят в зависимости проекта — проверяем заранее, а не после таймаута запуска
+    commands = [SERVERS[mode](0, 1)[0] for mode in modes]
+    missing = [command for command in commands if shutil.which(command) is None]
+    if missing:
+        sys.exit(f"не найдены {', '.join(missing)}: установите их (pip install {' '.join(missing)}) "
+                 f"или передайте --base-url уже запущенного сервера")
+
+
+def start_server(mode, port, workers):
+    process = subprocess.Popen(SERVERS[mode](port, workers), cwd=BASE_DIR,
+                               env=dict(os.environ, RESPONSE_CACHE_ENABLED='0'),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', ENDPOINTS[mode][0])
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit(f'{mode}: сервер не запустился на порту {port}')
+
+
+def worker(base_url, path, stop_at, latencies, errors):
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except OSError as error:
+            errors.append(repr(error))
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+def run(base_url, path, concurrency, duration):
+    latencies, errors = [], []
+    stop_at = time.monotonic() + duration
+    threads = [threading.Thread(target=worker, args=(base_url, path, stop_at, latencies, errors))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    if not latencies:
+        return {'rps': 0, 'p50_ms': None, 'p99_ms': None, 'errors': len(errors)}
+    return {
+        'rps': len(latencies) / duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+    parser.add_argument('--base-url', help='не запускать сервер, а нагружать уже работающий')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    modes = ['wsgi', 'asgi'] if args.mode == 'both' else [args.mode]
+    if args.base_url is None:
+        check_servers(modes)
+    for offset, mode in enumerate(modes):
+        process = None
+        base_url = args.base_url
+        if base_url is None:
+            port = 8100 + offset
+            process = start_server(mode, port, args.workers)
+            base_url = f'http://127.0.0.1:{port}'
+        try:
+            for path in ENDPOINTS[mode]:
+                result = run(base_url, path, args.concurrency, args.duration)
+                p50 = f"{result['p50_ms']:.1f}" if result['p50_ms'] is not None else '-'
+                p99 = f"{result['p99_ms']:.1f}" if result['p99_ms'] is not None else '-'
+                print(f"{mode} {path:<32} {result['rps']:>8.1f} req/s  p50 {p50:>7} ms  "
+                      f"p99 {p99:>7} ms  errors {result['errors']}")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
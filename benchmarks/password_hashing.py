@@ -0,0 +1,67 @@
+"""
+Логины в секунду (всего и на ядро): ModelBackend с проверкой пароля в потоке запроса
+против main.hashing.PooledModelBackend с проверкой пароля в ограниченном пуле.
+
+    python benchmarks/password_hashing.py --threads 16 --duration 5
+"""
+import argparse
+import os
+import threading
+import time
+
+from utils import setup_django, test_database
+
+
+def run(login, threads, duration):
+    from django.db import connection
+    from rest_framework.exceptions import Throttled
+
+    counters = {'ok': 0, 'throttled': 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < stop_at:
+            try:
+                assert login('athlete', 'Secret-123') is not None
+                result = 'ok'
+            except Throttled:
+                result = 'throttled'
+            with lock:
+                counters[result] += 1
+        connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=(os.cpu_count() or 1) * 2)
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.backends import ModelBackend
+    from django.contrib.auth.models import User
+    from main.hashing import PooledModelBackend
+
+    cores = os.cpu_count() or 1
+    with test_database():
+        User.objects.create_user('athlete', password='Secret-123')
+        for label, login in (
+            ('inline', lambda username, password: ModelBackend().authenticate(None, username, password)),
+            ('pool', lambda username, password: PooledModelBackend().authenticate(None, username, password)),
+        ):
+            counters = run(login, args.threads, args.duration)
+            rate = counters['ok'] / args.duration
+            print(f"{label:>6}: {rate:8.1f} logins/s  {rate / cores:7.1f} per core  "
+                  f"429: {counters['throttled']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Поиск по постерам: FTS5 (main.search) против Poster.objects.filter(text__icontains=...).
+
+    python benchmarks/poster_search.py --posters 20000
+"""
+import argparse
+import random
+
+from utils import measure, setup_django, test_database
+
+WORDS = ('тренировка', 'бокс', 'группа', 'зал', 'соревнования', 'тренер', 'расписание', 'набор',
+         'начинающих', 'йога', 'самбо', 'бассейн', 'открытие', 'турнир', 'победа', 'спортсмен')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posters', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from main.models import Poster
+    from main.search import rebuild_index, search_posters
+
+    with test_database():
+        rng = random.Random(1)
+        # Редкое слово встречается примерно в одном постере из тысячи
+        Poster.objects.bulk_create(
+            Poster(picture='posters/bench.png', title=' '.join(rng.choices(WORDS, k=3)),
+                   text=' '.join(rng.choices(WORDS, k=300) + (['олимпиада'] if rng.random() < 0.001 else [])))
+            for _ in range(args.posters)
+        )
+        rebuild_index()
+        for query in ('олимпиада', 'турнир', 'соревнования самбо'):
+            _, fts = measure(lambda: search_posters(query, 20), args.repeat)
+            _, naive = measure(lambda: list(Poster.objects.filter(text__icontains=query)[:20]), args.repeat)
+            print(f"{query!r:>24}: fts5 median {fts['median_ms']:.2f} ms, "
+                  f"icontains median {naive['median_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Пропускная способность чтения SQLite во время параллельной записи: с настройками SQLITE_PRAGMAS
+(WAL, synchronous=NORMAL, mmap...) и с настройками SQLite по умолчанию.
+
+    python benchmarks/sqlite_concurrency.py --readers 8 --writers 2 --duration 5
+"""
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from utils import setup_django
+
+
+def run(database, readers, writers, duration):
+    from django.db import OperationalError, connection, connections
+    from django.core.management import call_command
+    from main.models import Poster
+
+    connections['default'].settings_dict['NAME'] = database
+    connection.close()
+    call_command('migrate', verbosity=0)
+    Poster.objects.bulk_create(
+        Poster(picture=f'posters/{number}.png', title=f'Пост {number}', text='Текст ' * 50)
+        for number in range(500)
+    )
+
+    stop_at = time.monotonic() + duration
+    counters = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            counters[name] += 1
+
+    def reader():
+        while time.monotonic() < stop_at:
+            try:
+                list(Poster.objects.order_by('-publish_date', '-id')[:20])
+                count('reads')
+            except OperationalError:
+                count('locked')
+        connection.close()
+
+    def writer():
+        while time.monotonic() < stop_at:
+            try:
+                Poster.objects.create(picture='posters/new.png', title='Новый', text='Текст')
+                count('writes')
+            except OperationalError:
+                count('locked')
+        connection.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {name: value / duration if name != 'locked' else value for name, value in counters.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    tuned_pragmas = settings.SQLITE_PRAGMAS
+    with tempfile.TemporaryDirectory() as directory:
+        for label, pragmas in (('default', {}), ('tuned', tuned_pragmas)):
+            settings.SQLITE_PRAGMAS = pragmas
+            result = run(str(Path(directory) / f'{label}.sqlite3'), args.readers, args.writers, args.duration)
+            print(f"{label:>8}: {result['reads']:>9.1f} reads/s  {result['writes']:>7.1f} writes/s  "
+                  f"locked errors {result['locked']}")
+
+
+if __name__ == '__main__':
+    main()
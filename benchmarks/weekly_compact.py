@@ -0,0 +1,62 @@
+"""
+Сравнение размера ответа и времени сериализации /api/schedule/weekly/
+в полном и компактном (?view=compact) режимах.
+
+    python benchmarks/weekly_compact.py --members 200 --slots 40
+"""
+import argparse
+import datetime
+
+from utils import measure, setup_django, test_database
+
+
+def populate(members, slots):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from main.models import Gym, Image, Location, Schedule
+
+    location = Location.objects.create(latitude=56.84, longitude=60.61, address='Екатеринбург')
+    gym = Gym.objects.create(name='Benchmark Gym', location=location)
+    gym.pictures.add(Image.objects.create(image='gyms/benchmark.png'))
+    profiles = []
+    for number in range(members):
+        user = User.objects.create(username=f'member_{number}', first_name='Имя', last_name='Фамилия')
+        profile = user.userprofile
+        profile.gyms.add(gym)
+        profiles.append(profile)
+
+    monday = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+    monday -= datetime.timedelta(days=monday.weekday())
+    for number in range(slots):
+        Schedule.objects.create(
+            group=number,
+            address=location.address,
+            timestamp=monday + datetime.timedelta(days=number % 7, hours=number // 7 % 7),
+            club=gym,
+            user=profiles[number % 4],
+        )
+    return gym
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--slots', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.test import APIClient
+
+    with test_database():
+        gym = populate(args.members, args.slots)
+        client = APIClient()
+        for label, params in (('full', {}), ('compact', {'view': 'compact'})):
+            params = dict(params, gym=gym.slug)
+            response, timings = measure(lambda: client.get('/api/schedule/weekly/', params), args.repeat)
+            print(f"{label:>8}: {len(response.content):>10} bytes  "
+                  f"median {timings['median_ms']:.1f} ms  min {timings['min_ms']:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
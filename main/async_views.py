@@ -0,0 +1,89 @@
+"""
+ASGI-версии публичных эндпоинтов чтения. Работают через асинхронный ORM Django и не занимают
+поток из пула sync_to_async на всё время запроса. Ответы совпадают с соответствующими DRF-view.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from .models import Gym, Poster, Schedule, UserProfile
+from .pagination import IdCursorPagination, PosterCursorPagination
+from .serializers import (CompactWeeklyScheduleSerializer, CompactGymSerializer, CompactUserProfileSerializer,
+                          GymSerializer, PosterSerializer, UserProfileSerializer, WeeklyScheduleSerializer)
+from .views import ScheduleFilter, ScheduleViewSet
+
+
+async def paginate(request, queryset, pagination_class, serializer_class):
+    drf_request = Request(request)
+    paginator = pagination_class()
+    # Выборка страницы делается одним запросом в потоке ORM; сериализация — уже без БД
+    page = await sync_to_async(paginator.paginate_queryset)(queryset, drf_request)
+    data = serializer_class(page, many=True, context={'request': drf_request}).data
+    return JsonResponse(paginator.get_paginated_response(data).data)
+
+
+async def poster_list(request):
+    return await paginate(request, Poster.objects.all(), PosterCursorPagination, PosterSerializer)
+
+
+async def poster_detail(request, pk):
+    try:
+        poster = await Poster.objects.aget(pk=pk)
+    except Poster.DoesNotExist:
+        return JsonResponse({'error': 'Poster not found'}, status=404)
+    return JsonResponse(PosterSerializer(poster, context={'request': Request(request)}).data)
+
+
+async def gym_list(request):
+    queryset = GymSerializer.setup_eager_loading(Gym.objects.all())
+    return await paginate(request, queryset, IdCursorPagination, GymSerializer)
+
+
+async def gym_detail(request, slug):
+    queryset = GymSerializer.setup_eager_loading(Gym.objects.filter(slug=slug))
+    gym = await queryset.afirst()
+    if gym is None:
+        raise Http404
+    return JsonResponse(GymSerializer(gym, context={'request': Request(request)}).data)
+
+
+async def weekly_schedule(request):
+    view = ScheduleViewSet()
+    filterset = ScheduleFilter(request.GET, queryset=Schedule.objects.all())
+    # Как и DjangoFilterBackend: некорректный фильтр — это 400, а не пустая неделя
+    if not filterset.is_valid():
+        return JsonResponse(filterset.errors, status=400)
+    queryset = filterset.qs
+    try:
+        queryset = view.get_weekly_queryset(queryset, request.GET.get('week'))
+    except ValidationError as error:
+        return JsonResponse(error.detail, status=400)
+    events = [event async for event in queryset]
+
+    compact = request.GET.get('view') == 'compact'
+    gym_serializer = CompactGymSerializer if compact else GymSerializer
+    user_serializer = CompactUserProfileSerializer if compact else UserProfileSerializer
+    club_ids = {event.club_id for event in events}
+    user_ids = {event.user_id for event in events}
+
+    # Клубы и пользователи не зависят друг от друга — запрашиваем их одновременно
+    clubs, users = await asyncio.gather(
+        _in_bulk(gym_serializer.setup_eager_loading(Gym.objects.filter(id__in=club_ids))),
+        _in_bulk(user_serializer.setup_eager_loading(UserProfile.objects.filter(id__in=user_ids))),
+    )
+    schedule = view.get_weekly_schedule(events)
+    if compact:
+        data = CompactWeeklyScheduleSerializer({'schedule': schedule, 'clubs': clubs, 'users': users}).data
+    else:
+        for event in events:
+            event.club = clubs[event.club_id]
+            event.user = users[event.user_id]
+        data = WeeklyScheduleSerializer(schedule).data
+    return JsonResponse(data)
+
+
+async def _in_bulk(queryset):
+    return {obj.id: obj async for obj in queryset}
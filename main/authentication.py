@@ -0,0 +1,103 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import bump_version, get_versions
+
+
+class TokenCache:
+    """
+    Ограниченный по размеру и времени жизни LRU-кэш token.key -> (Token с загруженным user, поколение).
+    Кэш живёт в памяти процесса; запись действительна, пока поколение пользователя в общем кэше
+    версий (main.cache) не изменилось, поэтому удаление токена или деактивация в одном воркере
+    сразу действуют во всех.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, token, generation):
+        with self._lock:
+            self._entries[key] = ((token, generation), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for key in [key for key, ((token, _), _) in self._entries.items() if token.user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'TOKEN_CACHE_MAX_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 300),
+)
+
+
+def _generation_label(user_id):
+    return f'token-user:{user_id}'
+
+
+def get_user_generation(user_id):
+    return get_versions([_generation_label(user_id)])[0]
+
+
+def bump_user_generation(user_id):
+    """Делает недействительными закэшированные токены пользователя во всех процессах."""
+    bump_version(_generation_label(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None and entry[1] == get_user_generation(entry[0].user_id):
+            token = entry[0]
+        else:
+            # Пользователь токена известен заранее, если запись была: тогда поколение читается до
+            # запроса к БД, и изменение, закоммиченное между ними, сбросит новую запись. Для нового
+            # токена окно между запросом и чтением поколения ограничено TTL
+            generation = get_user_generation(entry[0].user_id) if entry is not None else None
+            user, token = super().authenticate_credentials(key)
+            if entry is None:
+                generation = get_user_generation(user.pk)
+            token_cache.set(key, token, generation)
+        # Каждый запрос получает свои копии: request.user не разделяется между потоками
+        user = copy.copy(token.user)
+        token = copy.copy(token)
+        token.user = user
+        return (user, token)
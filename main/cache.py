@@ -0,0 +1,165 @@
+"""
+Кэш ответов с инвалидацией по версиям моделей.
+
+Версии хранятся отдельно от ответов, в кэше RESPONSE_VERSION_CACHE_ALIAS, который должен быть
+общим для всех процессов: запись в одном воркере меняет версию, и остальные перестают отдавать
+старые ответы и ETag. По умолчанию это файловый кэш (общий для воркеров одной машины); при
+нескольких машинах нужен сетевой бэкенд (Redis, Memcached). Кэш в памяти процесса для версий
+корректен только с одним процессом — об этом предупреждает проверка main.W001.
+"""
+import os
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Файловый кэш с вытеснением давно не читанных записей вместо случайных
+class LRUFileBasedCache(FileBasedCache):
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        if value is self._missing:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        filelist.sort(key=self._mtime)
+        for fname in filelist[:max(1, num_entries // self._cull_frequency)]:
+            self._delete(fname)
+
+    @staticmethod
+    def _mtime(fname):
+        try:
+            return os.path.getmtime(fname)
+        except FileNotFoundError:
+            return 0
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def get_version_cache():
+    return caches[getattr(settings, 'RESPONSE_VERSION_CACHE_ALIAS', 'default')]
+
+
+@checks.register(checks.Tags.caches)
+def check_version_cache(app_configs, **kwargs):
+    if isinstance(get_version_cache(), LocMemCache):
+        return [checks.Warning(
+            'Версии кэша ответов хранятся в памяти процесса.',
+            hint='Запись в одном воркере не сбросит ответы и ETag других: укажите в '
+                 'RESPONSE_VERSION_CACHE_ALIAS общий кэш (файловый, Redis) или запускайте один процесс.',
+            id='main.W001',
+        )]
+    return []
+
+
+def _version_key(label):
+    return f'response-version:{label}'
+
+
+def _now_version():
+    # Версия — время изменения в миллисекундах: из неё же берётся Last-Modified,
+    # а вытесненный счётчик не может вернуться к значению, под которым лежат старые ответы
+    return int(time.time() * 1000)
+
+
+def get_versions(labels):
+    cache = get_version_cache()
+    keys = [_version_key(label) for label in labels]
+    versions = cache.get_many(keys)
+    missing = {key: _now_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _bump(label):
+    cache = get_version_cache()
+    key = _version_key(label)
+    current = cache.get(key, 0)
+    cache.set(key, max(current + 1, _now_version()), timeout=None)
+
+
+def bump_version(label):
+    _bump(label)
+    # Повторно после коммита: ответ, закэшированный между сигналом и коммитом, содержит старые данные
+    transaction.on_commit(lambda: _bump(label))
+
+
+def get_validators(labels, key):
+    """ETag-дайджест и Last-Modified (в секундах) для ответа с ключом key по версиям моделей."""
+    versions = get_versions(labels)
+    key_source = '|'.join([key, *map(str, versions)])
+    return md5(key_source.encode(), usedforsecurity=False).hexdigest(), max(versions) // 1000
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since'))
+    return bool(if_modified_since and if_modified_since >= last_modified)
+
+
+def cache_response(*labels, vary_on=None):
+    """
+    Кэширует данные GET-ответа под ключом, зависящим от версий перечисленных моделей,
+    и отдаёт ETag/Last-Modified с поддержкой 304. vary_on(view, request) добавляет к ключу
+    то, от чего ответ зависит помимо URL (например, текущая неделя). Если у view есть
+    is_response_cacheable(request) и он вернул False, запрос обрабатывается без кэша; при
+    RESPONSE_CACHE_ENABLED = False — все запросы.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if not getattr(settings, 'RESPONSE_CACHE_ENABLED', True):
+                return view_method(self, request, *args, **kwargs)
+            is_cacheable = getattr(self, 'is_response_cacheable', None)
+            if is_cacheable is not None and not is_cacheable(request):
+                return view_method(self, request, *args, **kwargs)
+            digest, last_modified = get_validators(labels, '|'.join([
+                request.build_absolute_uri(),
+                request.accepted_renderer.format,
+                vary_on(self, request) if vary_on else '',
+            ]))
+            etag = f'"{digest}"'
+            headers = {'ETag': etag, 'Last-Modified': http_date(last_modified)}
+            if is_not_modified(request, etag, last_modified):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+            cache = get_cache()
+            cache_key = f'response:{digest}'
+            data = cache.get(cache_key)
+            if data is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                data = response.data
+                cache.set(cache_key, data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+            return Response(data, headers=headers)
+        return wrapper
+    return decorator
@@ -0,0 +1,108 @@
+"""
+Синтетические данные для нагрузочных тестов: залы с адресами и фотографиями, профили с
+членством в залах и связями тренер/ученик, расписание и постеры. Всё создаётся через
+bulk_create, поэтому служебные данные, которые обычно ведут сигналы (профили, поисковый
+индекс, недельная сетка, счётчики членства, версии кэша), обновляются здесь явно.
+"""
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import grid, search
+from .cache import bump_version
+from .models import Gym, Image, Location, Membership, Poster, Schedule, UserProfile
+
+FIRST_NAMES = ('Иван', 'Анна', 'Пётр', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Елена', 'Сергей', 'Наталья')
+LAST_NAMES = ('Иванов', 'Петрова', 'Сидоров', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов', 'Лебедева')
+WORDS = ('тренировка', 'бокс', 'группа', 'зал', 'соревнования', 'тренер', 'расписание', 'набор',
+         'начинающих', 'йога', 'самбо', 'бассейн', 'открытие', 'турнир', 'победа', 'спортсмен')
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize()
+
+
+@transaction.atomic
+def generate(gyms=10, profiles=200, schedule=500, posters=100, memberships=2, seed=1, batch_size=500):
+    rng = random.Random(seed)
+    prefix = f'bench{seed}'
+
+    locations = []
+    for number in range(gyms):
+        latitude = 56.84 + rng.uniform(-0.2, 0.2)
+        longitude = 60.61 + rng.uniform(-0.3, 0.3)
+        # Ячейку сетки заполняет LocationQuerySet.bulk_create
+        locations.append(Location(latitude=latitude, longitude=longitude,
+                                  address=f'Екатеринбург, ул. Спортивная, {number + 1}'))
+    locations = Location.objects.bulk_create(locations, batch_size=batch_size)
+    gym_objects = Gym.objects.bulk_create([
+        Gym(name=f'Зал {number}', slug=f'{prefix}-gym-{number}', location=location,
+            description=_text(rng, 20))
+        for number, location in enumerate(locations)
+    ], batch_size=batch_size)
+    images = Image.objects.bulk_create([Image(image=f'gyms/{prefix}-{number}.jpg') for number in range(gyms * 3)],
+                                       batch_size=batch_size)
+    Gym.pictures.through.objects.bulk_create([
+        Gym.pictures.through(gym_id=gym.id, image_id=images[index * 3 + offset].id)
+        for index, gym in enumerate(gym_objects) for offset in range(3)
+    ], batch_size=batch_size)
+
+    # Один хэш на всех пользователей: хэширование пароля на каждого заняло бы минуты
+    password = make_password(BENCHMARK_PASSWORD)
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}-user-{number}', password=password, email=f'{prefix}-{number}@example.com',
+             first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES))
+        for number in range(profiles)
+    ], batch_size=batch_size)
+    profile_objects = UserProfile.objects.bulk_create([
+        UserProfile(user=user, is_staff=number % 20 == 0, phone_number=f'+7999{number:07d}',
+                    description=_text(rng, 10), group_number=str(number % 12))
+        for number, user in enumerate(users)
+    ], batch_size=batch_size)
+
+    Membership.objects.bulk_create([
+        Membership(profile_id=profile.id, gym_id=gym.id)
+        for profile in profile_objects for gym in rng.sample(gym_objects, min(memberships, len(gym_objects)))
+    ], batch_size=batch_size)
+    Membership.refresh_counters(gym_ids=[gym.id for gym in gym_objects],
+                                profile_ids=[profile.id for profile in profile_objects])
+
+    trainers = [profile for profile in profile_objects if profile.is_staff] or profile_objects[:1]
+    UserProfile.trainees.through.objects.bulk_create([
+        UserProfile.trainees.through(from_userprofile_id=rng.choice(trainers).id, to_userprofile_id=profile.id)
+        for profile in profile_objects if profile not in trainers
+    ], batch_size=batch_size, ignore_conflicts=True)
+
+    monday = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    monday -= datetime.timedelta(days=monday.weekday())
+    Schedule.objects.bulk_create([
+        Schedule(group=rng.randint(1, 12), address=gym.location.address, club=gym, user=rng.choice(trainers),
+                 timestamp=monday + datetime.timedelta(weeks=rng.randint(-4, 4), days=rng.randint(0, 6),
+                                                       hours=rng.randint(9, 21)))
+        for gym in (rng.choice(gym_objects) for _ in range(schedule))
+    ], batch_size=batch_size)
+
+    Poster.objects.bulk_create([
+        Poster(picture=f'posters/{prefix}-{number}.jpg', title=_text(rng, 4), description=_text(rng, 8),
+               text=_text(rng, 200))
+        for number in range(posters)
+    ], batch_size=batch_size)
+
+    if search.is_available():
+        search.rebuild_index()
+    grid.rebuild_all(batch_size=batch_size)
+    for model in (Poster, Gym, Image, Location, UserProfile, Schedule):
+        bump_version(model._meta.label)
+
+    return {
+        'gyms': len(gym_objects),
+        'profiles': len(profile_objects),
+        'schedule': schedule,
+        'posters': posters,
+        'prefix': prefix,
+    }
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created, dispatch_uid='sqlite-pragmas')
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    # Настройки SQLite действуют на соединение, поэтому задаются при каждом его открытии;
+    # при CONN_MAX_AGE это происходит один раз на воркер, а не на каждый запрос
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
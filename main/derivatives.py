@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage, ImageOps
+
+from .cache import bump_version
+
+EXIF_ORIENTATION = 0x0112
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Оригиналы (имя, время изменения), для которых генерация уже запускалась в этом процессе (в т.ч.
+# слишком маленькие): LRU ограниченного размера, перезаписанный под тем же именем файл получает новый ключ.
+# Значение — готовые ширины, когда набор копий известен полностью, иначе None
+_scheduled = OrderedDict()
+_scheduled_lock = threading.Lock()
+
+
+def get_widths():
+    return getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 1280))
+
+
+def derivative_name(name, width, extension):
+    # posters/poster.png -> posters/poster_320w.webp, рядом с оригиналом
+    root, _ = os.path.splitext(name)
+    return f'{root}_{width}w.{extension}'
+
+
+def original_extension(name):
+    extension = os.path.splitext(name)[1].lower().lstrip('.')
+    return 'jpg' if extension == 'jpeg' else extension or 'jpg'
+
+
+def _save(storage, name, image, image_format, **options):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_derivatives(storage, name):
+    try:
+        with storage.open(name) as source:
+            original = ImageOps.exif_transpose(PILImage.open(source))
+            original.load()
+        extension = original_extension(name)
+        original_format = 'JPEG' if extension == 'jpg' else original.format or 'JPEG'
+        for width in get_widths():
+            if width >= original.width:
+                continue
+            resized = original.copy()
+            resized.thumbnail((width, original.height * width // original.width + 1), PILImage.LANCZOS)
+            if original_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                resized = resized.convert('RGB')
+            _save(storage, derivative_name(name, width, extension), resized, original_format, optimize=True)
+            # WebP пишется последним: его наличие означает, что размер готов целиком
+            _save(storage, derivative_name(name, width, 'webp'), resized, 'WEBP', quality=80, method=4)
+    except FileNotFoundError:
+        logger.debug('Оригинал %s не найден', name)
+        return False
+    except (OSError, ValueError):
+        logger.warning('Не удалось построить уменьшенные копии %s', name, exc_info=True)
+        _forget(name)
+        return False
+    return True
+
+
+def _generate_and_invalidate(storage, name, label):
+    if generate_derivatives(storage, name):
+        # Закэшированные ответы ещё не содержат srcset для новых копий
+        bump_version(label)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def _schedule_key(field_file):
+    try:
+        return field_file.name, field_file.storage.get_modified_time(field_file.name).timestamp()
+    except (OSError, NotImplementedError):
+        return field_file.name, None
+
+
+def _forget(name):
+    with _scheduled_lock:
+        for key in [key for key in _scheduled if key[0] == name]:
+            del _scheduled[key]
+
+
+def _remember(key, ready):
+    # Вызывается под _scheduled_lock
+    _scheduled[key] = ready
+    _scheduled.move_to_end(key)
+    while len(_scheduled) > getattr(settings, 'IMAGE_DERIVATIVE_SCHEDULED_MAX', 10000):
+        _scheduled.popitem(last=False)
+
+
+def _expected_widths(storage, name):
+    # Какие копии строит generate_derivatives: PIL читает только заголовок оригинала
+    try:
+        with storage.open(name) as source:
+            image = PILImage.open(source)
+            width, height = image.size
+            if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                width = height
+    except (OSError, ValueError):
+        return None
+    return tuple(size for size in get_widths() if size < width)
+
+
+def schedule_derivatives(field_file):
+    """Ставит генерацию копий в пул воркеров, не блокируя поток запроса."""
+    if not field_file:
+        return None
+    key = _schedule_key(field_file)
+    with _scheduled_lock:
+        if key in _scheduled:
+            _scheduled.move_to_end(key)
+            return None
+        _remember(key, None)
+    return get_executor().submit(
+        _generate_and_invalidate, field_file.storage, field_file.name, field_file.instance._meta.label
+    )
+
+
+def get_srcset(field_file, build_url=None):
+    """
+    Возвращает {'webp': 'url 320w, url 640w', '<формат оригинала>': ...} по уже готовым копиям.
+    Если копий ещё нет, ставит их генерацию в очередь (ленивый режим для старых загрузок).
+    """
+    if not field_file:
+        return None
+    build_url = build_url or (lambda url: url)
+    storage = field_file.storage
+    extension = original_extension(field_file.name)
+    # Готовый набор копий берётся из LRU по (имя, mtime) оригинала: один stat вместо exists() на ширину
+    key = _schedule_key(field_file)
+    with _scheduled_lock:
+        ready = _scheduled.get(key)
+        if ready is not None:
+            _scheduled.move_to_end(key)
+    if ready is None:
+        ready = tuple(width for width in get_widths()
+                      if storage.exists(derivative_name(field_file.name, width, 'webp')))
+        # Частичный набор бывает, пока копии ещё строятся (в т.ч. другим процессом) — его не запоминаем
+        if key[1] is not None and (len(ready) == len(get_widths())
+                                   or ready == _expected_widths(storage, field_file.name)):
+            with _scheduled_lock:
+                _remember(key, ready)
+    if not ready:
+        schedule_derivatives(field_file)
+        return {}
+    return {
+        file_format: ', '.join(
+            f'{build_url(storage.url(derivative_name(field_file.name, width, file_format)))} {width}w'
+            for width in ready
+        )
+        for file_format in ('webp', extension)
+    }
@@ -0,0 +1,168 @@
+"""
+Потоковая выгрузка расписания: CSV по фильтрам списка и iCalendar-ленты пользователя или клуба.
+
+Строки читаются из БД порциями через .iterator(chunk_size) и сразу отдаются клиенту, поэтому
+память не зависит от числа занятий. Ленты iCalendar отдают ETag/Last-Modified по версиям
+кэша (main.cache): календарь, опрашивающий ленту, получает 304 без единого SQL-запроса.
+"""
+import csv
+import datetime
+
+from django.conf import settings
+from django.http import Http404, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .cache import get_validators, is_not_modified
+from .models import Gym, Schedule, UserProfile
+from .views import ScheduleFilter
+
+ICAL_CACHE_MODELS = ('main.Schedule', 'main.Gym', 'main.UserProfile')
+CSV_COLUMNS = ('id', 'timestamp', 'group', 'address', 'club', 'club_name', 'user', 'username',
+               'first_name', 'last_name')
+# Занятия в сетке расписания почасовые
+EVENT_DURATION = 'PT1H'
+BUFFER_SIZE = 64 * 1024
+
+
+def get_chunk_size():
+    return getattr(settings, 'SCHEDULE_EXPORT_CHUNK_SIZE', 2000)
+
+
+def filter_by_dates(queryset, params):
+    # from/to — даты (включительно) в текущей таймзоне
+    bounds = {}
+    for name, lookup, shift in (('from', 'timestamp__gte', 0), ('to', 'timestamp__lt', 1)):
+        if params.get(name):
+            try:
+                date = datetime.date.fromisoformat(params[name]) + datetime.timedelta(days=shift)
+            except ValueError:
+                return None, {name: 'Ожидается дата в формате 2024-05-06.'}
+            bounds[lookup] = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+    return queryset.filter(**bounds), None
+
+
+def buffered(chunks):
+    # Отдаём куски по ~64 КБ, а не по строке: меньше накладных расходов сервера на каждый кусок
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        yield writer.writerow((row[0], timezone.localtime(row[1]).isoformat(), *row[2:]))
+
+
+@require_safe
+def export_csv(request):
+    filterset = ScheduleFilter(request.GET, queryset=Schedule.objects.all())
+    if not filterset.is_valid():
+        return JsonResponse(filterset.errors, status=400)
+    queryset, errors = filter_by_dates(filterset.qs, request.GET)
+    if errors:
+        return JsonResponse(errors, status=400)
+
+    rows = queryset.order_by('timestamp', 'id').values_list(
+        'id', 'timestamp', 'group', 'address', 'club__slug', 'club__name', 'user_id',
+        'user__user__username', 'user__user__first_name', 'user__user__last_name',
+    ).iterator(chunk_size=get_chunk_size())
+    response = StreamingHttpResponse(buffered(csv_lines(rows)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="schedule.csv"'
+    return response
+
+
+def ical_escape(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def ical_time(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def fold(line):
+    # RFC 5545: строки не длиннее 75 октетов, продолжение начинается с пробела
+    if len(line.encode()) <= 75:
+        return line + '\r\n'
+    parts = []
+    current = ''
+    size = 0
+    for char in line:
+        length = len(char.encode())
+        if size + length > 75:
+            parts.append(current)
+            current = ' '
+            size = 1
+        current += char
+        size += length
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def ical_lines(name, rows, domain):
+    yield from map(fold, (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//projectWeb//Schedule//RU',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{ical_escape(name)}',
+    ))
+    for pk, timestamp, group, address, club_name, updated_at in rows:
+        yield from map(fold, (
+            'BEGIN:VEVENT',
+            f'UID:schedule-{pk}@{domain}',
+            f'DTSTAMP:{ical_time(updated_at)}',
+            f'DTSTART:{ical_time(timestamp)}',
+            f'DURATION:{EVENT_DURATION}',
+            f'SUMMARY:{ical_escape(f"Группа {group} — {club_name}")}',
+            f'LOCATION:{ical_escape(address)}',
+            'END:VEVENT',
+        ))
+    yield fold('END:VCALENDAR')
+
+
+@require_safe
+def export_ical(request, kind, key):
+    digest, last_modified = get_validators(ICAL_CACHE_MODELS, request.build_absolute_uri())
+    headers = {'ETag': f'"{digest}"', 'Last-Modified': http_date(last_modified)}
+    if is_not_modified(request, headers['ETag'], last_modified):
+        return HttpResponseNotModified(headers=headers)
+
+    queryset, errors = filter_by_dates(Schedule.objects.all(), request.GET)
+    if errors:
+        return JsonResponse(errors, status=400)
+    if kind == 'club':
+        gym = Gym.objects.filter(slug=key).only('name').first()
+        if gym is None:
+            raise Http404
+        name, queryset = gym.name, queryset.filter(club=gym)
+    else:
+        profile = UserProfile.objects.filter(pk=key).select_related('user').only('user', 'user__username').first()
+        if profile is None:
+            raise Http404
+        name, queryset = profile.user.username, queryset.filter(user=profile)
+
+    rows = queryset.order_by('timestamp', 'id').values_list(
+        'id', 'timestamp', 'group', 'address', 'club__name', 'updated_at',
+    ).iterator(chunk_size=get_chunk_size())
+    response = StreamingHttpResponse(buffered(ical_lines(name, rows, request.get_host())),
+                                     content_type='text/calendar; charset=utf-8', headers=headers)
+    response['Content-Disposition'] = f'inline; filename="{kind}-{key}.ics"'
+    return response
@@ -0,0 +1,49 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+# Размер ячейки сетки Location.cell в градусах (~28 км по широте)
+CELL_DEGREES = 0.25
+LAT_CELLS = int(180 / CELL_DEGREES)
+LON_CELLS = int(360 / CELL_DEGREES)
+
+
+def _lat_index(latitude):
+    return min(int((latitude + 90) // CELL_DEGREES), LAT_CELLS - 1)
+
+
+def _lon_index(longitude):
+    return int((longitude + 180) // CELL_DEGREES) % LON_CELLS
+
+
+def cell_for(latitude, longitude):
+    return _lat_index(latitude) * LON_CELLS + _lon_index(longitude)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        # У полюса окружность охватывает все долготы
+        return min_lat, max_lat, -180.0, 180.0
+    lon_delta = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) /
+                                             math.cos(math.radians(latitude)))))
+    return min_lat, max_lat, longitude - lon_delta, longitude + lon_delta
+
+
+def cells_for_box(min_lat, max_lat, min_lon, max_lon):
+    lon_span = LON_CELLS if max_lon - min_lon >= 360 else None
+    first_lon = int((min_lon + 180) // CELL_DEGREES)
+    last_lon = int((max_lon + 180) // CELL_DEGREES)
+    lon_indexes = range(LON_CELLS) if lon_span else {index % LON_CELLS for index in range(first_lon, last_lon + 1)}
+    return [
+        lat_index * LON_CELLS + lon_index
+        for lat_index in range(_lat_index(min_lat), _lat_index(max_lat) + 1)
+        for lon_index in lon_indexes
+    ]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,148 @@
+"""
+Материализованная недельная сетка расписания по клубу и по тренеру (модель WeeklyGrid).
+
+Сетка хранит готовую часть schedule компактного ответа /api/schedule/weekly/: дни, часы
+с пустыми слотами 12–18 и события со ссылками на клуб и пользователя по id. Сигналы Schedule
+пересчитывают только затронутый слот (main.signals), пакетные пути — целые недели
+(rebuild_weeks). Расхождения с живыми данными находит manage.py check_weekly_grid.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.timezone import localtime, make_aware
+
+from .models import Schedule, WeeklyGrid
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DEFAULT_HOURS = range(12, 19)
+OWNERS = ('club', 'user')
+
+
+def slot_start(timestamp):
+    # Слот сетки расписания — час в локальном времени
+    return localtime(timestamp).replace(minute=0, second=0, microsecond=0)
+
+
+def week_start(timestamp):
+    local = localtime(timestamp).date()
+    return local - datetime.timedelta(days=local.weekday())
+
+
+def empty_slots():
+    return {day: {str(hour): {'time': hour, 'event': None} for hour in DEFAULT_HOURS} for day in DAYS}
+
+
+def event_data(group, address, club_id, user_id):
+    return {'group': group, 'address': address, 'club': club_id, 'user': user_id}
+
+
+def set_slot(slots, timestamp, event):
+    local = localtime(timestamp)
+    day = slots[DAYS[local.weekday()]]
+    if event is None and local.hour not in DEFAULT_HOURS:
+        day.pop(str(local.hour), None)
+    else:
+        day[str(local.hour)] = {'time': local.hour, 'event': event}
+    slots[DAYS[local.weekday()]] = dict(sorted(day.items(), key=lambda item: int(item[0])))
+
+
+def build_slots(rows):
+    """Сетка недели из строк (timestamp, group, address, club_id, user_id) по возрастанию времени."""
+    slots = empty_slots()
+    # Как и в живой сетке, из нескольких занятий одного часа выводится последнее
+    for timestamp, group, address, club_id, user_id in rows:
+        set_slot(slots, timestamp, event_data(group, address, club_id, user_id))
+    return slots
+
+
+def week_rows(owner, owner_id, start):
+    begin = make_aware(datetime.datetime.combine(start, datetime.time.min))
+    end = make_aware(datetime.datetime.combine(start + datetime.timedelta(days=7), datetime.time.min))
+    return Schedule.objects.filter(**{f'{owner}_id': owner_id}, timestamp__gte=begin, timestamp__lt=end).order_by(
+        'timestamp', 'id').values_list('timestamp', 'group', 'address', 'club_id', 'user_id')
+
+
+def refresh_slot(owner, owner_id, timestamp):
+    """Пересчитывает один часовой слот сетки владельца (owner — 'club' или 'user')."""
+    start = slot_start(timestamp)
+    with transaction.atomic():
+        grid = WeeklyGrid.objects.select_for_update().filter(
+            **{f'{owner}_id': owner_id}, week_start=week_start(timestamp)).first()
+        # Событие читается под блокировкой строки сетки: параллельная запись в тот же слот
+        # дождётся её и запишет уже своё, актуальное состояние
+        event = Schedule.objects.filter(**{f'{owner}_id': owner_id}, timestamp__gte=start,
+                                        timestamp__lt=start + datetime.timedelta(hours=1)).order_by(
+            'timestamp', 'id').values_list('group', 'address', 'club_id', 'user_id').last()
+        if grid is None:
+            if event is None:
+                return
+            grid = WeeklyGrid(**{f'{owner}_id': owner_id}, week_start=week_start(timestamp), slots=empty_slots())
+        set_slot(grid.slots, timestamp, event_data(*event) if event else None)
+        grid.save()
+
+
+def rebuild_weeks(schedules):
+    """Пересобирает недели, которых касаются занятия (для bulk_create, который не шлёт сигналов)."""
+    keys = {(owner, getattr(schedule, f'{owner}_id'), week_start(schedule.timestamp))
+            for schedule in schedules for owner in OWNERS}
+    if not keys:
+        return
+    starts = {start for _, _, start in keys}
+    owners = Q(club_id__in={owner_id for owner, owner_id, _ in keys if owner == 'club'}) | Q(
+        user_id__in={owner_id for owner, owner_id, _ in keys if owner == 'user'})
+    rows = Schedule.objects.filter(
+        owners,
+        timestamp__gte=make_aware(datetime.datetime.combine(min(starts), datetime.time.min)),
+        timestamp__lt=make_aware(datetime.datetime.combine(max(starts) + datetime.timedelta(days=7),
+                                                           datetime.time.min)),
+    ).order_by('timestamp', 'id').values_list('timestamp', 'group', 'address', 'club_id', 'user_id')
+    weeks = defaultdict(list)
+    for row in rows:
+        for owner in OWNERS:
+            key = (owner, row[3] if owner == 'club' else row[4], week_start(row[0]))
+            if key in keys:
+                weeks[key].append(row)
+
+    grids = {}
+    for grid in WeeklyGrid.objects.filter(owners, week_start__in=starts):
+        owner = 'club' if grid.club_id else 'user'
+        grids[(owner, getattr(grid, f'{owner}_id'), grid.week_start)] = grid
+    created, updated = [], []
+    for key in keys:
+        owner, owner_id, start = key
+        slots = build_slots(weeks[key])
+        if key in grids:
+            grids[key].slots = slots
+            grids[key].updated_at = timezone.now()
+            updated.append(grids[key])
+        else:
+            created.append(WeeklyGrid(**{f'{owner}_id': owner_id}, week_start=start, slots=slots))
+    WeeklyGrid.objects.bulk_create(created)
+    WeeklyGrid.objects.bulk_update(updated, ['slots', 'updated_at'])
+
+
+def expected_grids(owner, chunk_size=2000):
+    """{(owner_id, week_start): slots} по живым данным, одним потоковым проходом по расписанию."""
+    rows = defaultdict(list)
+    for timestamp, group, address, club_id, user_id in Schedule.objects.order_by('timestamp', 'id').values_list(
+            'timestamp', 'group', 'address', 'club_id', 'user_id').iterator(chunk_size=chunk_size):
+        owner_id = club_id if owner == 'club' else user_id
+        rows[(owner_id, week_start(timestamp))].append((timestamp, group, address, club_id, user_id))
+    return {key: build_slots(week) for key, week in rows.items()}
+
+
+def rebuild_all(batch_size=500):
+    with transaction.atomic():
+        WeeklyGrid.objects.all().delete()
+        for owner in OWNERS:
+            WeeklyGrid.objects.bulk_create([
+                WeeklyGrid(**{f'{owner}_id': owner_id}, week_start=start, slots=slots)
+                for (owner_id, start), slots in expected_grids(owner).items()
+            ], batch_size=batch_size)
+
+
+def is_empty(slots):
+    return all(slot['event'] is None for day in slots.values() for slot in day.values())
@@ -0,0 +1,85 @@
+"""
+Хэширование и проверка паролей в ограниченном пуле потоков.
+
+PBKDF2 из hashlib отпускает GIL, поэтому пул даёт настоящую параллельность по ядрам, а его
+размер ограничивает, сколько воркеров одновременно заняты хэшированием. Если очередь пула
+заполнена, запрос сразу получает 429, а не ждёт в очереди.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.contrib.auth.models import User
+from rest_framework.exceptions import Throttled
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _get_pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 1
+            queue = getattr(settings, 'PASSWORD_HASHING_QUEUE', None) or workers * 4
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+            _slots = threading.BoundedSemaphore(workers + queue)
+        return _executor, _slots
+
+
+def run_hashing(func, *args):
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise Throttled(wait=1, detail='Сервер перегружен, повторите попытку позже.')
+    try:
+        return executor.submit(func, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(raw_password):
+    return run_hashing(make_password, raw_password)
+
+
+def must_update_password(encoded):
+    """Нужно ли перехэшировать пароль: другой алгоритм по умолчанию или устаревшие параметры."""
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify_password(raw_password, encoded):
+    return run_hashing(check_password, raw_password, encoded)
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend, проверяющий пароль в пуле. Вход идёт через django.contrib.auth.authenticate,
+    поэтому работают AUTHENTICATION_BACKENDS и сигнал user_login_failed.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Как и ModelBackend, тратим время на хэш, чтобы не выдавать существование логина
+            hash_password(password)
+            return None
+        if not verify_password(password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if must_update_password(user.password):
+            # Запись — в потоке запроса, в его соединении и транзакции; в пуле только хэш
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        return user
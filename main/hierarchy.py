@@ -0,0 +1,91 @@
+"""
+Иерархия тренер -> ученик (UserProfile.trainees) рекурсивным CTE: все потомки или предки
+профиля на любой глубине и размер поддерева — одним SQL-запросом вне зависимости от глубины.
+
+WITH RECURSIVE работает и в SQLite, и в PostgreSQL. Циклы не даёт создать сигнал m2m_changed
+(main.signals); на случай уже существующих циклов обход ограничен HIERARCHY_MAX_DEPTH уровнями.
+"""
+from django.conf import settings
+from django.db import connection
+
+from .models import UserProfile
+
+DOWN = 'down'
+UP = 'up'
+
+
+def get_max_depth():
+    return getattr(settings, 'HIERARCHY_MAX_DEPTH', 50)
+
+
+def _edges(direction):
+    """(таблица, колонка-источник, колонка-цель) связей тренер -> ученик в направлении обхода."""
+    through = UserProfile.trainees.through._meta
+    table = connection.ops.quote_name(through.db_table)
+    trainer = connection.ops.quote_name(through.get_field('from_userprofile').column)
+    trainee = connection.ops.quote_name(through.get_field('to_userprofile').column)
+    return (table, trainer, trainee) if direction == DOWN else (table, trainee, trainer)
+
+
+def _tree_sql(direction):
+    table, source, target = _edges(direction)
+    # Узел, достижимый несколькими путями, берётся с минимальной глубиной
+    return f'''
+        WITH RECURSIVE tree(id, depth) AS (
+            SELECT {target}, 1 FROM {table} WHERE {source} = %s
+            UNION
+            SELECT edge.{target}, tree.depth + 1
+            FROM {table} AS edge JOIN tree ON edge.{source} = tree.id
+            WHERE tree.depth < %s
+        )
+        SELECT id, MIN(depth) AS depth FROM tree WHERE id <> %s GROUP BY id
+    '''
+
+
+def walk(profile_id, direction=DOWN, max_depth=None):
+    """[(id, depth)] потомков (DOWN) или предков (UP) по возрастанию глубины."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'{_tree_sql(direction)} ORDER BY depth, id',
+                       [profile_id, max_depth or get_max_depth(), profile_id])
+        return cursor.fetchall()
+
+
+def subtree_size(profile_id, max_depth=None):
+    """(число потомков, число уровней) одним запросом."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*), COALESCE(MAX(depth), 0) FROM ({_tree_sql(DOWN)}) AS subtree',
+                       [profile_id, max_depth or get_max_depth(), profile_id])
+        return cursor.fetchone()
+
+
+def load_profiles(nodes, queryset):
+    """Профили узлов [(id, depth)] одним запросом (плюс prefetch), в порядке обхода, с атрибутом depth."""
+    depths = dict(nodes)
+    profiles = {profile.id: profile for profile in queryset.filter(id__in=depths)}
+    result = []
+    for pk, depth in nodes:
+        if pk in profiles:
+            profiles[pk].depth = depth
+            result.append(profiles[pk])
+    return result
+
+
+def creates_cycle(trainer_id, trainee_ids):
+    """Замкнёт ли связь trainer -> trainee цикл: ученик уже среди предков тренера или он сам."""
+    trainee_ids = set(trainee_ids)
+    if trainer_id in trainee_ids:
+        return True
+    # Без глубины в строках: UNION отбрасывает уже найденные id, поэтому обход без ограничения
+    # уровней заканчивается и на уже существующем цикле, каждый предок посещается один раз
+    table, source, target = _edges(UP)
+    placeholders = ', '.join(['%s'] * len(trainee_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            WITH RECURSIVE ancestors(id) AS (
+                SELECT {target} FROM {table} WHERE {source} = %s
+                UNION
+                SELECT edge.{target} FROM {table} AS edge JOIN ancestors ON edge.{source} = ancestors.id
+            )
+            SELECT 1 FROM ancestors WHERE id IN ({placeholders}) LIMIT 1
+        ''', [trainer_id, *trainee_ids])
+        return cursor.fetchone() is not None
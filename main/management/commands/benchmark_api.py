@@ -0,0 +1,119 @@
+import json
+import time
+from itertools import count
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from main.datagen import BENCHMARK_PASSWORD, generate
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'bytes')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные эндпоинты API через тестовый клиент на синтетических данных и '
+            'записывает перцентили задержки, число запросов к БД и размер ответа в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gyms', type=int, default=10)
+        parser.add_argument('--profiles', type=int, default=200)
+        parser.add_argument('--schedule', type=int, default=500)
+        parser.add_argument('--posters', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', help='Куда записать результаты (JSON)')
+        parser.add_argument('--compare', help='Результаты предыдущего прогона для сравнения (JSON)')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый относительный рост задержки и размера ответа')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Не сбрасывать кэш ответов между запросами')
+
+    def handle(self, *args, **options):
+        # Замеры идут на отдельной тестовой базе, рабочая не затрагивается
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            data = generate(gyms=options['gyms'], profiles=options['profiles'],
+                            schedule=options['schedule'], posters=options['posters'])
+            results = self.run_benchmarks(data, options['repeat'], options['warm_cache'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(f"{name:<24} " + '  '.join(f'{metric} {result[metric]:>9.1f}' for metric in METRICS))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'scale': {key: options[key] for key in ('gyms', 'profiles', 'schedule', 'posters')},
+                           'results': results}, file, indent=2, ensure_ascii=False)
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'])
+
+    def get_requests(self, data):
+        prefix = data['prefix']
+        registrations = count()
+        return {
+            'gyms': lambda client: client.get('/api/gyms/'),
+            'gym_detail': lambda client: client.get(f'/api/gyms/{prefix}-gym-0/'),
+            'profiles': lambda client: client.get('/api/profiles/'),
+            'blog': lambda client: client.get('/api/blog/'),
+            'schedule_weekly': lambda client: client.get('/api/schedule/weekly/', {'gym': f'{prefix}-gym-0'}),
+            'schedule_weekly_compact': lambda client: client.get(
+                '/api/schedule/weekly/', {'gym': f'{prefix}-gym-0', 'view': 'compact'}),
+            'auth_login': lambda client: client.post(
+                '/api/auth/login/', {'username': f'{prefix}-user-1', 'password': BENCHMARK_PASSWORD}, format='json'),
+            'auth_register': lambda client: client.post('/api/auth/register/', {
+                'username': f'{prefix}-new-{next(registrations)}', 'password': BENCHMARK_PASSWORD,
+                'first_name': 'Имя', 'last_name': 'Фамилия', 'email': 'new@example.com',
+            }, format='json'),
+        }
+
+    def run_benchmarks(self, data, repeat, warm_cache):
+        client = APIClient()
+        results = {}
+        for name, send in self.get_requests(data).items():
+            timings, queries, sizes = [], [], []
+            for _ in range(repeat):
+                if not warm_cache:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = send(client)
+                    timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    raise CommandError(f'{name}: ответ {response.status_code}')
+                queries.append(len(captured))
+                sizes.append(len(response.content))
+            results[name] = {
+                'p50_ms': percentile(timings, 0.5),
+                'p95_ms': percentile(timings, 0.95),
+                'p99_ms': percentile(timings, 0.99),
+                'queries': max(queries),
+                'bytes': max(sizes),
+            }
+        return results
+
+    def compare(self, results, path, threshold):
+        with open(path) as file:
+            baseline = json.load(file)['results']
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(f"{name}: запросов к БД {before['queries']} -> {result['queries']}")
+            for metric in ('p50_ms', 'bytes'):
+                if result[metric] > before[metric] * (1 + threshold):
+                    regressions.append(f'{name}: {metric} {before[metric]:.1f} -> {result[metric]:.1f}')
+        if regressions:
+            raise CommandError('Регрессии относительно {}:\n{}'.format(path, '\n'.join(regressions)))
+        self.stdout.write(self.style.SUCCESS(f'Регрессий относительно {path} нет'))
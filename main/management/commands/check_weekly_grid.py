@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import grid
+from main.models import WeeklyGrid
+
+
+class Command(BaseCommand):
+    help = 'Сверяет материализованную недельную сетку с расписанием; с --repair исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Перезаписать расходящиеся недели')
+
+    def handle(self, *args, **options):
+        problems = 0
+        for owner in grid.OWNERS:
+            stored = {(getattr(row, f'{owner}_id'), row.week_start): row
+                      for row in WeeklyGrid.objects.filter(**{f'{owner}__isnull': False})}
+            for (owner_id, week_start), slots in grid.expected_grids(owner).items():
+                row = stored.pop((owner_id, week_start), None)
+                if row is not None and row.slots == slots:
+                    continue
+                problems += 1
+                self.stdout.write(f'{owner} {owner_id}, неделя {week_start}: '
+                                  f'{"нет сетки" if row is None else "сетка расходится с расписанием"}')
+                if options['repair']:
+                    WeeklyGrid.objects.update_or_create(**{f'{owner}_id': owner_id}, week_start=week_start,
+                                                        defaults={'slots': slots})
+            # Оставшиеся сетки относятся к неделям без занятий и должны быть пустыми
+            for (owner_id, week_start), row in stored.items():
+                if grid.is_empty(row.slots):
+                    continue
+                problems += 1
+                self.stdout.write(f'{owner} {owner_id}, неделя {week_start}: занятия в сетке, но не в расписании')
+                if options['repair']:
+                    row.delete()
+
+        if problems and not options['repair']:
+            raise CommandError(f'Расхождений: {problems}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено недель: {problems}' if problems else 'Сетка совпадает с расписанием'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from main.datagen import generate
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими залами, профилями, расписанием и постерами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gyms', type=int, default=10)
+        parser.add_argument('--profiles', type=int, default=200)
+        parser.add_argument('--schedule', type=int, default=500)
+        parser.add_argument('--posters', type=int, default=100)
+        parser.add_argument('--memberships', type=int, default=2, help='Залов на один профиль')
+        parser.add_argument('--seed', type=int, default=1, help='Разные seed дают непересекающиеся данные')
+
+    def handle(self, *args, **options):
+        result = generate(
+            gyms=options['gyms'],
+            profiles=options['profiles'],
+            schedule=options['schedule'],
+            posters=options['posters'],
+            memberships=options['memberships'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: залов {gyms}, профилей {profiles}, занятий {schedule}, постеров {posters}'.format(**result)
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from main import schema
+
+
+class Command(BaseCommand):
+    help = 'Генерирует OpenAPI-схему текущей версии кода в API_SCHEMA_DIR (запускается при сборке)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help='Удалить схемы других версий')
+
+    def handle(self, *args, **options):
+        version = schema.get_schema_version()
+        path = schema.write_artifact(version)
+        if options['prune']:
+            for old in schema.get_schema_dir().glob('openapi-*.json*'):
+                if not old.name.startswith(f'openapi-{version}.'):
+                    old.unlink()
+        self.stdout.write(self.style.SUCCESS(f'Схема версии {version}: {path}'))
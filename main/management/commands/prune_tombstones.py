@@ -0,0 +1,20 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Удаляет записи журнала удалений старше срока хранения (SYNC_TOMBSTONE_RETENTION_DAYS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+    def handle(self, *args, **options):
+        # Курсоры старше этого срока sync и так отклоняет с 410, записи для них не нужны
+        threshold = timezone.now() - datetime.timedelta(days=options['days'])
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=threshold).delete()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей журнала: {deleted}'))
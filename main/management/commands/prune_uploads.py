@@ -0,0 +1,35 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.models import Upload
+from main.uploads import get_upload_dir, remove_upload
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные возобновляемые загрузки и их файлы (UPLOAD_RESUMABLE_TTL_HOURS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=getattr(settings, 'UPLOAD_RESUMABLE_TTL_HOURS', 24))
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - datetime.timedelta(hours=options['hours'])
+        deleted = 0
+        for upload in Upload.objects.filter(updated_at__lt=threshold).iterator():
+            remove_upload(upload)
+            deleted += 1
+
+        # Файлы без записи: части прерванных запросов (.chunk) и загрузки, удалённые вместе с пользователем
+        known = {str(pk) for pk in Upload.objects.values_list('pk', flat=True)}
+        cutoff = time.time() - options['hours'] * 3600
+        orphans = 0
+        for path in get_upload_dir().iterdir():
+            if path.suffix not in ('.part', '.chunk') or (path.suffix == '.part' and path.stem in known):
+                continue
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                orphans += 1
+        self.stdout.write(self.style.SUCCESS(f'Удалено загрузок: {deleted}, файлов без записи: {orphans}'))
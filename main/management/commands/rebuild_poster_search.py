@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.search import is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс постеров (FTS5)'
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite.')
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано постеров: {count}'))
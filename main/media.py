@@ -0,0 +1,132 @@
+import hashlib
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+# Имена, в которых есть хэш содержимого, никогда не меняют содержимое
+HASHED_NAME = re.compile(r'(^|[/._-])[0-9a-f]{16,}\.[^/]+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=4096)
+def _content_hash(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_etag(path, stat):
+    if getattr(settings, 'MEDIA_OFFLOAD', None):
+        # Байты отдаёт фронт-сервер: файл не читаем, ETag из mtime и размера в формате nginx
+        return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    # Ключ кэша включает mtime и размер, поэтому перезаписанный файл получит новый ETag
+    return f'"{_content_hash(path, stat.st_mtime_ns, stat.st_size)[:32]}"'
+
+
+def get_cache_control(path):
+    if HASHED_NAME.search(path):
+        return 'public, max-age=31536000, immutable'
+    return f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+
+
+def parse_range(header, size):
+    # Поддерживается один диапазон; на несколько диапазонов отвечаем целым файлом
+    match = RANGE.match(header.strip())
+    if not match or match[1] == match[2] == '':
+        return None
+    if match[1] == '':
+        start = max(size - int(match[2]), 0)
+        end = size - 1
+    else:
+        start = int(match[1])
+        end = min(int(match[2]), size - 1) if match[2] else size - 1
+    if start > end or start >= size:
+        raise ValueError
+    return start, end
+
+
+def read_range(file, start, length):
+    file.seek(start)
+    try:
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError, SuspiciousFileOperation):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = get_etag(full_path, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': get_cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    # Отдачу байтов можно переложить на nginx (X-Accel-Redirect) или Apache/lighttpd (X-Sendfile),
+    # они же обработают Range. Путь в заголовке percent-кодируется: иначе кириллица, пробелы
+    # и «?»/«#» в имени файла ломают заголовок; nginx и mod_xsendfile раскодируют его сами
+    offload = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if offload:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(getattr(settings, 'MEDIA_OFFLOAD_PREFIX', '/protected-media/') + path)
+        else:
+            response['X-Sendfile'] = quote(full_path)
+        return response
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416, headers=headers)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                read_range(open(full_path, 'rb'), start, length),
+                status=206, content_type=content_type, headers=headers,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(length)
+            return response
+
+    # FileResponse отдаёт файл через wsgi.file_wrapper (sendfile), без копирования в Python
+    return FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
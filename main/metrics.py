@@ -0,0 +1,235 @@
+"""
+Метрики запросов по маршрутам: задержка (гистограмма), число SQL-запросов и время в БД,
+время сериализации (.data) и размер ответа. Отдаются в текстовом формате Prometheus на /metrics
+адресам из METRICS_ALLOWED_IPS.
+
+Метрики хранятся в памяти процесса: при нескольких воркерах каждый отдаёт свои.
+"""
+import bisect
+import contextvars
+import ipaddress
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+class RouteStats:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.response_bytes = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteStats)
+
+    def observe(self, route, method, status, duration, metrics, size):
+        with self._lock:
+            stats = self._routes[(route, method, str(status))]
+            index = bisect.bisect_left(LATENCY_BUCKETS, duration)
+            if index < len(stats.buckets):
+                stats.buckets[index] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += metrics.queries
+            stats.db_time += metrics.db_time
+            stats.serialization_time += metrics.serialization_time
+            stats.response_bytes += size
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        lines = [
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            routes = sorted(self._routes.items())
+            for (route, method, status), stats in routes:
+                labels = f'route="{route}",method="{method}",status="{status}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {stats.duration}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {stats.count}')
+            for name, attribute in (
+                ('http_request_db_queries_total', 'queries'),
+                ('http_request_db_seconds_total', 'db_time'),
+                ('http_request_serialization_seconds_total', 'serialization_time'),
+                ('http_response_size_bytes_total', 'response_bytes'),
+            ):
+                lines.append(f'# TYPE {name} counter')
+                for (route, method, status), stats in routes:
+                    labels = f'route="{route}",method="{method}",status="{status}"'
+                    lines.append(f'{name}{{{labels}}} {getattr(stats, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+_timed_classes = {}
+
+
+def _timed_class(cls):
+    # Подкласс сериализатора (или ListSerializer) с учётом времени .data; isinstance не ломается
+    if cls not in _timed_classes:
+        def data(self):
+            started = time.perf_counter()
+            try:
+                return super(timed_cls, self).data
+            finally:
+                metrics = _current.get()
+                if metrics is not None:
+                    metrics.serialization_time += time.perf_counter() - started
+
+        timed_cls = type(cls)(cls.__name__, (cls,), {'data': property(data), '__module__': cls.__module__})
+        _timed_classes[cls] = timed_cls
+    return _timed_classes[cls]
+
+
+def timed(serializer):
+    """Учитывает время вычисления serializer.data во времени сериализации текущего запроса."""
+    if type(serializer) not in _timed_classes.values():
+        serializer.__class__ = _timed_class(type(serializer))
+    return serializer
+
+
+class InstrumentedViewMixin:
+    """Для DRF-view: сериализаторы из get_serializer учитываются во времени сериализации."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        # drf_yasg различает сериализаторы по классу: при генерации схемы подкласс с таймером не нужен
+        if getattr(self, 'swagger_fake_view', False):
+            return serializer
+        return timed(serializer)
+
+
+def get_query_budget(route):
+    budgets = getattr(settings, 'METRICS_QUERY_BUDGETS', {})
+    return budgets.get(route, getattr(settings, 'METRICS_QUERY_BUDGET', None))
+
+
+def _record(execute, sql, params, many, context):
+    # Обёртка стоит на соединении постоянно; запрос учитывается, если он выполняется внутри
+    # замеряемого запроса. Контекст переходит и в потоки sync_to_async, поэтому учитываются
+    # и запросы async-view (main.async_views)
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(connection, **kwargs):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+connection_created.connect(install_execute_wrapper, dispatch_uid='metrics-execute-wrapper')
+
+
+class MetricsMiddleware:
+    """Работает и в WSGI, и в ASGI без перевода async-обработчиков в поток."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Соединения, открытые до загрузки middleware, сигнал connection_created уже пропустили
+        for connection in connections.all(initialized_only=True):
+            install_execute_wrapper(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if request.path == '/metrics':
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if request.path == '/metrics':
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, metrics, duration):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(route, request.method, response.status_code, duration, metrics, size)
+
+        budget = get_query_budget(route)
+        if budget is not None and metrics.queries > budget:
+            logger.warning('%s %s (%s): %d SQL-запросов при бюджете %d, %.1f мс в БД',
+                           request.method, request.path, route, metrics.queries, budget, metrics.db_time * 1000)
+
+
+def is_allowed_scraper(request):
+    # Метрики раскрывают маршруты и нагрузку: отдаются только адресам из METRICS_ALLOWED_IPS
+    address = ipaddress.ip_address(request.META.get('REMOTE_ADDR') or '0.0.0.0')
+    networks = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def metrics_view(request):
+    if not is_allowed_scraper(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_image_location_rename_image_poster_picture_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gym',
+            name='slug',
+            field=models.SlugField(blank=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='gym',
+            name='users',
+            field=models.ManyToManyField(null=True, related_name='user_profiles', to='main.userprofile'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='gyms',
+            field=models.ManyToManyField(null=True, related_name='members', to='main.gym'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='phone_number',
+            field=models.CharField(max_length=15, null=True, verbose_name='Телефонный номер'),
+        ),
+        migrations.CreateModel(
+            name='Schedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.IntegerField(verbose_name='Группа')),
+                ('address', models.CharField(max_length=255, verbose_name='Адрес')),
+                ('timestamp', models.DateTimeField(verbose_name='Метка времени')),
+                ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.gym', verbose_name='Клуб')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.userprofile', verbose_name='Пользователь')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_schedule_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poster',
+            index=models.Index(fields=['-publish_date', '-id'], name='poster_publish_date_idx'),
+        ),
+    ]
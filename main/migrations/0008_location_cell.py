@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+# Копия main.geo.cell_for на момент миграции: сетка 0.25°, чтобы её изменения не меняли миграцию
+CELL_DEGREES = 0.25
+LAT_CELLS = int(180 / CELL_DEGREES)
+LON_CELLS = int(360 / CELL_DEGREES)
+
+
+def cell_for(latitude, longitude):
+    lat_index = min(int((latitude + 90) // CELL_DEGREES), LAT_CELLS - 1)
+    lon_index = int((longitude + 180) // CELL_DEGREES) % LON_CELLS
+    return lat_index * LON_CELLS + lon_index
+
+
+def fill_cells(apps, schema_editor):
+    Location = apps.get_model('main', 'Location')
+    locations = list(Location.objects.all())
+    for location in locations:
+        location.cell = cell_for(location.latitude, location.longitude)
+    Location.objects.bulk_update(locations, ['cell'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_poster_publish_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='cell',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Ячейка сетки'),
+        ),
+        migrations.RunPython(fill_cells, migrations.RunPython.noop),
+    ]
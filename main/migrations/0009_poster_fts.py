@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS main_poster_fts USING fts5("
+        "title, description, text, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    Poster = apps.get_model('main', 'Poster')
+    for poster in Poster.objects.all().iterator():
+        schema_editor.execute(
+            'INSERT INTO main_poster_fts (rowid, title, description, text) VALUES (%s, %s, %s, %s)',
+            [poster.pk] + [(value or '').replace('ё', 'е').replace('Ё', 'Е')
+                           for value in (poster.title, poster.description, poster.text)],
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS main_poster_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_location_cell'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
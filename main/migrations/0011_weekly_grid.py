@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:48
+
+import datetime
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.timezone import localtime
+
+# Копия формата сетки на момент миграции (main.grid), чтобы её изменения не меняли миграцию
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DEFAULT_HOURS = range(12, 19)
+OWNERS = ('club', 'user')
+
+
+def week_start(timestamp):
+    local = localtime(timestamp).date()
+    return local - datetime.timedelta(days=local.weekday())
+
+
+def build_slots(rows):
+    slots = {day: {str(hour): {'time': hour, 'event': None} for hour in DEFAULT_HOURS} for day in DAYS}
+    for timestamp, group, address, club_id, user_id in rows:
+        local = localtime(timestamp)
+        day = slots[DAYS[local.weekday()]]
+        day[str(local.hour)] = {'time': local.hour, 'event': {
+            'group': group, 'address': address, 'club': club_id, 'user': user_id}}
+        slots[DAYS[local.weekday()]] = dict(sorted(day.items(), key=lambda item: int(item[0])))
+    return slots
+
+
+def fill_grids(apps, schema_editor):
+    Schedule = apps.get_model('main', 'Schedule')
+    WeeklyGrid = apps.get_model('main', 'WeeklyGrid')
+    rows = list(Schedule.objects.order_by('timestamp', 'id').values_list(
+        'timestamp', 'group', 'address', 'club_id', 'user_id'))
+    for owner in OWNERS:
+        weeks = defaultdict(list)
+        for row in rows:
+            weeks[(row[3] if owner == 'club' else row[4], week_start(row[0]))].append(row)
+        WeeklyGrid.objects.bulk_create([
+            WeeklyGrid(**{f'{owner}_id': owner_id}, week_start=start, slots=build_slots(week))
+            for (owner_id, start), week in weeks.items()
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyGrid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField(verbose_name='Понедельник недели')),
+                ('slots', models.JSONField(default=dict, verbose_name='Слоты')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменена')),
+                ('club', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='weekly_grids', to='main.gym')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='weekly_grids', to='main.userprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('club', 'week_start'), name='weeklygrid_club_week_uniq'), models.UniqueConstraint(fields=('user', 'week_start'), name='weeklygrid_user_week_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_grids, migrations.RunPython.noop),
+    ]
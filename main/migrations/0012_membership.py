@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_memberships(apps, schema_editor):
+    # Объединяем обе старые таблицы: связь, записанная хотя бы в одну из них, считается членством
+    UserProfile = apps.get_model('main', 'UserProfile')
+    Gym = apps.get_model('main', 'Gym')
+    Membership = apps.get_model('main', 'Membership')
+    pairs = set(UserProfile.gyms.through.objects.values_list('userprofile_id', 'gym_id'))
+    pairs |= set(Gym.users.through.objects.values_list('userprofile_id', 'gym_id'))
+    Membership.objects.bulk_create([Membership(profile_id=profile_id, gym_id=gym_id) for profile_id, gym_id in pairs],
+                                   batch_size=500)
+
+    for model, related, field in ((Gym, 'gym', 'members_count'), (UserProfile, 'profile', 'gyms_count')):
+        counts = Membership.objects.values_list(related).annotate(total=Count('id'))
+        model.objects.bulk_update([model(pk=pk, **{field: total}) for pk, total in counts], [field], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_weekly_grid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gym',
+            name='members_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число участников'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='gyms_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число залов'),
+        ),
+        migrations.CreateModel(
+            name='Membership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('joined_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата вступления')),
+                ('gym', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='main.gym')),
+                ('profile', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='main.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['gym', 'profile'], name='membership_gym_profile_idx')],
+                'constraints': [models.UniqueConstraint(fields=('profile', 'gym'), name='membership_profile_gym_uniq')],
+            },
+        ),
+        migrations.RunPython(merge_memberships, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='gym',
+            name='users',
+        ),
+        # Поменять обычную M2M на M2M через модель нельзя изменением поля — пересоздаём его
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='gyms',
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='gyms',
+            field=models.ManyToManyField(blank=True, related_name='users', through='main.Membership', to='main.gym'),
+        ),
+    ]
@@ -1,10 +1,17 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.text import slugify
 from rest_framework.exceptions import ValidationError
 
+from .geo import cell_for
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -12,9 +19,16 @@ class UserProfile(models.Model):
     avatar = models.ImageField(upload_to='user_avatars/', null=True, blank=True, verbose_name='Аватар')
     phone_number = models.CharField(max_length=15, null=True, blank=False, verbose_name='Телефонный номер')
     description = models.TextField(null=True, blank=True, verbose_name='О себе')
-    gyms = models.ManyToManyField('Gym', null=True, related_name='members')
+    gyms = models.ManyToManyField('Gym', through='Membership', related_name='users', blank=True)
     trainees = models.ManyToManyField('self', symmetrical=False, related_name='trainers', blank=True)
     group_number = models.CharField(max_length=15, null=True, blank=True, verbose_name='Номер группы')
+    gyms_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Число залов')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='userprofile_updated_at_idx'),
+        ]
 
     def clean(self):
         if not self.user.first_name or not self.user.last_name or not self.user.email:
@@ -34,14 +48,60 @@ class Poster(models.Model):
     description = models.CharField(max_length=255, null=True, blank=True)
     text = models.TextField()
     publish_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-publish_date', '-id'], name='poster_publish_date_idx'),
+            models.Index(fields=['updated_at', 'id'], name='poster_updated_at_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+class LocationQuerySet(models.QuerySet):
+    """Пересчитывает Location.cell и там, где save() не вызывается: update, bulk_create, bulk_update."""
+
+    def update(self, **kwargs):
+        if 'latitude' not in kwargs and 'longitude' not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            # Фильтр может зависеть от координат, поэтому строки запоминаются до обновления
+            ids = list(self.values_list('pk', flat=True))
+            count = super().update(**kwargs)
+            locations = list(self.model.objects.using(self.db).filter(pk__in=ids).only('latitude', 'longitude'))
+            for location in locations:
+                location.cell = cell_for(location.latitude, location.longitude)
+            self.model.objects.using(self.db).bulk_update(locations, ['cell'], batch_size=500)
+        return count
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.cell = cell_for(obj.latitude, obj.longitude)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'latitude' in fields or 'longitude' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.cell = cell_for(obj.latitude, obj.longitude)
+            fields = [*fields, 'cell'] if 'cell' not in fields else fields
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Location(models.Model):
     latitude = models.FloatField(verbose_name='Широта')
     longitude = models.FloatField(verbose_name='Долгота')
     address = models.CharField(max_length=200, verbose_name='Адрес')
+    # Ячейка географической сетки (main.geo) для поиска ближайших залов по индексу
+    cell = models.IntegerField(default=0, db_index=True, editable=False, verbose_name='Ячейка сетки')
+
+    objects = LocationQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.cell = cell_for(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.latitude}, {self.longitude} - {self.address}"
@@ -56,7 +116,13 @@ class Gym(models.Model):
     pictures = models.ManyToManyField(Image, related_name='gyms')
     description = models.TextField(null=True, blank=True, verbose_name='Описание зала')
     location = models.OneToOneField(Location, on_delete=models.CASCADE)
-    users = models.ManyToManyField(UserProfile, null=True, related_name='user_profiles')  # Изменено related_name для предотвращения конфликта
+    members_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Число участников')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='gym_updated_at_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:  # Генерируем slug только если он еще не установлен
@@ -73,3 +139,82 @@ class Schedule(models.Model):
     timestamp = models.DateTimeField(verbose_name='Метка времени')
     club = models.ForeignKey(Gym, on_delete=models.CASCADE, verbose_name='Клуб')
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, verbose_name='Пользователь')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['club', 'timestamp'], name='schedule_club_timestamp_idx'),
+            models.Index(fields=['user', 'timestamp'], name='schedule_user_timestamp_idx'),
+            models.Index(fields=['updated_at', 'id'], name='schedule_updated_at_idx'),
+        ]
+
+
+# Членство профиля в зале: единственная связь UserProfile.gyms / Gym.users
+class Membership(models.Model):
+    # Отдельные индексы по FK не нужны: их покрывают составные индексы ниже
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, db_index=False, related_name='memberships')
+    gym = models.ForeignKey(Gym, on_delete=models.CASCADE, db_index=False, related_name='memberships')
+    joined_at = models.DateTimeField(default=timezone.now, verbose_name='Дата вступления')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'gym'], name='membership_profile_gym_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['gym', 'profile'], name='membership_gym_profile_idx'),
+        ]
+
+    @staticmethod
+    def refresh_counters(gym_ids=(), profile_ids=()):
+        """Пересчитывает gyms_count/members_count по таблице членства (в текущей транзакции)."""
+        for model, ids, field, related in ((Gym, gym_ids, 'members_count', 'gym'),
+                                           (UserProfile, profile_ids, 'gyms_count', 'profile')):
+            if ids:
+                count = Membership.objects.filter(**{related: OuterRef('pk')}).values(related).annotate(
+                    total=Count('*')).values('total')
+                model.objects.filter(pk__in=ids).update(**{field: Coalesce(Subquery(count), 0)})
+
+
+# Материализованная недельная сетка (main.grid): готовые слоты недели одного клуба или тренера
+class WeeklyGrid(models.Model):
+    club = models.ForeignKey(Gym, null=True, blank=True, on_delete=models.CASCADE, related_name='weekly_grids')
+    user = models.ForeignKey(UserProfile, null=True, blank=True, on_delete=models.CASCADE, related_name='weekly_grids')
+    week_start = models.DateField(verbose_name='Понедельник недели')
+    slots = models.JSONField(default=dict, verbose_name='Слоты')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменена')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['club', 'week_start'], name='weeklygrid_club_week_uniq'),
+            models.UniqueConstraint(fields=['user', 'week_start'], name='weeklygrid_user_week_uniq'),
+        ]
+
+
+# Журнал удалений для инкрементальной синхронизации (main.sync): клиенту нужно знать,
+# какие из уже загруженных объектов больше не существуют
+class Tombstone(models.Model):
+    model = models.CharField(max_length=100, verbose_name='Модель')
+    object_id = models.IntegerField(verbose_name='Идентификатор объекта')
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Удалён')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'id'], name='tombstone_model_id_idx'),
+        ]
+
+
+# Возобновляемая загрузка файла по частям (main.uploads): данные копятся в UPLOAD_RESUMABLE_DIR,
+# offset — сколько байт уже принято
+class Upload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255, verbose_name='Имя файла')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    offset = models.PositiveBigIntegerField(default=0, verbose_name='Принято байт')
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name='SHA-256 содержимого')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменена')
+
+    @property
+    def complete(self):
+        return self.offset == self.size
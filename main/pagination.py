@@ -0,0 +1,51 @@
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
+
+
+# Keyset-пагинация: страница выбирается условием по индексированному ключу, без OFFSET
+class IdCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+
+
+class PosterCursorPagination(IdCursorPagination):
+    ordering = ('-publish_date', '-id')
+
+
+class PosterSearchPagination(IdCursorPagination):
+    """
+    Курсор выдачи полнотекстового поиска. Ранг bm25 считается в запросе и не является полем
+    модели, поэтому позиция курсора — пара (rank, id), а саму выборку делает main.search.
+    """
+
+    def paginate_search(self, search, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        after = None if cursor is None else self.parse_position(cursor.position)
+        # Лишняя строка показывает, есть ли следующая страница
+        posters = search(self.page_size + 1, after)
+        self.has_next = len(posters) > self.page_size
+        self.page = posters[:self.page_size]
+        return self.page
+
+    def parse_position(self, position):
+        try:
+            rank, pk = position.split('|')
+            return (float(rank) if rank else None, int(pk))
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        rank = '' if last.rank is None else repr(last.rank)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=f'{rank}|{last.pk}'))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
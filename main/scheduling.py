@@ -0,0 +1,100 @@
+"""
+Пакетное создание занятий расписания: проверка конфликтов несколькими запросами на весь пакет
+и вставка через bulk_create в одной транзакции.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import make_aware
+
+from .cache import bump_version
+from .grid import rebuild_weeks, slot_start
+from .models import Gym, Schedule, UserProfile
+
+
+def expand_recurrence(rule):
+    """Раскрывает правило (день недели, час, диапазон дат) в список занятий."""
+    items = []
+    day = rule['start_date'] + datetime.timedelta(days=(rule['weekday'] - rule['start_date'].weekday()) % 7)
+    while day <= rule['end_date']:
+        items.append({
+            'group': rule['group'],
+            'address': rule.get('address'),
+            'club': rule['club'],
+            'user': rule['user'],
+            'timestamp': make_aware(datetime.datetime.combine(day, datetime.time(rule['hour']))),
+        })
+        day += datetime.timedelta(days=7)
+    return items
+
+
+def validate_items(items):
+    """
+    Возвращает (schedules, errors): несохранённые объекты Schedule и ошибки по позициям пакета.
+    Клубы, пользователи и существующие занятия загружаются тремя запросами на весь пакет.
+    """
+    clubs = {gym.slug: gym for gym in Gym.objects.select_related('location').filter(
+        slug__in={item['club'] for item in items})}
+    users = set(UserProfile.objects.filter(id__in={item['user'] for item in items}).values_list('id', flat=True))
+
+    errors = defaultdict(dict)
+    for index, item in enumerate(items):
+        if item['club'] not in clubs:
+            errors[index]['club'] = 'Клуб не найден.'
+        if item['user'] not in users:
+            errors[index]['user'] = 'Пользователь не найден.'
+
+    club_slots = {}
+    user_slots = {}
+    if items:
+        slots = [slot_start(item['timestamp']) for item in items]
+        existing = Schedule.objects.filter(
+            Q(club_id__in=[gym.id for gym in clubs.values()]) | Q(user_id__in=users),
+            timestamp__gte=min(slots),
+            timestamp__lt=max(slots) + datetime.timedelta(hours=1),
+        ).values_list('club_id', 'user_id', 'timestamp')
+        for club_id, user_id, timestamp in existing:
+            club_slots[(club_id, slot_start(timestamp))] = None
+            user_slots[(user_id, slot_start(timestamp))] = None
+
+    schedules = []
+    for index, item in enumerate(items):
+        if index in errors:
+            continue
+        gym = clubs[item['club']]
+        slot = slot_start(item['timestamp'])
+        # Значение None — занято существующей записью, число — другой позицией этого же пакета
+        if (gym.id, slot) in club_slots:
+            other = club_slots[(gym.id, slot)]
+            errors[index]['timestamp'] = ('Время в клубе уже занято.' if other is None
+                                          else f'Время в клубе совпадает с позицией {other}.')
+        if (item['user'], slot) in user_slots:
+            other = user_slots[(item['user'], slot)]
+            errors[index]['user'] = ('Тренер в это время уже занят.' if other is None
+                                     else f'Тренер занят в позиции {other}.')
+        if index in errors:
+            continue
+        club_slots[(gym.id, slot)] = index
+        user_slots[(item['user'], slot)] = index
+        schedules.append(Schedule(
+            group=item['group'],
+            address=item.get('address') or gym.location.address,
+            timestamp=item['timestamp'],
+            club_id=gym.id,
+            user_id=item['user'],
+        ))
+    return schedules, [{'index': index, 'errors': item_errors} for index, item_errors in sorted(errors.items())]
+
+
+def bulk_create_schedule(items, batch_size=500):
+    with transaction.atomic():
+        schedules, errors = validate_items(items)
+        if errors:
+            return [], errors
+        created = Schedule.objects.bulk_create(schedules, batch_size=batch_size)
+        # bulk_create не отправляет post_save, поэтому недельную сетку и кэш ответов обновляем явно
+        rebuild_weeks(created)
+    bump_version(Schedule._meta.label)
+    return created, []
@@ -0,0 +1,157 @@
+"""
+OpenAPI-схема API, сгенерированная один раз на версию кода.
+
+drf_yasg обходит все viewset'ы и блоки swagger_auto_schema за сотни миллисекунд, поэтому
+документ строится при сборке (manage.py generate_openapi_schema) или при первом запросе
+и сохраняется в API_SCHEMA_DIR как openapi-<версия>.json и .json.gz. Версия — хэш исходников
+проекта и версий библиотек (или API_SCHEMA_VERSION из настроек, например git SHA): схема
+пересобирается только после выкладки нового кода. /openapi.json отдаёт готовые байты
+с ETag и gzip, страницы /swagger/ и /redoc/ читают схему оттуда (SPEC_URL). Тяжёлые части
+drf_yasg импортируются только при генерации схемы и первом открытии страниц документации.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from functools import lru_cache
+from importlib import import_module
+from pathlib import Path
+
+import django
+import drf_yasg
+import rest_framework
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.views.decorators.http import require_safe
+from drf_yasg import openapi
+from rest_framework import permissions
+
+INFO = openapi.Info(
+    title="API Documentation",
+    default_version='v1',
+    description="API documentation for all available endpoints",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@yourproject.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+_artifacts = {}
+_lock = threading.Lock()
+
+
+def source_roots():
+    roots = {Path(config.path) for config in apps.get_app_configs()
+             if Path(config.path).is_relative_to(settings.BASE_DIR)}
+    roots.add(Path(import_module(settings.ROOT_URLCONF).__file__).parent)
+    return sorted(roots)
+
+
+@lru_cache(maxsize=1)
+def get_schema_version():
+    configured = getattr(settings, 'API_SCHEMA_VERSION', None)
+    if configured:
+        return str(configured)
+    digest = hashlib.sha256(f'{django.__version__}|{rest_framework.VERSION}|{drf_yasg.__version__}'.encode())
+    for root in source_roots():
+        for path in sorted(root.rglob('*.py')):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def get_schema_dir():
+    return Path(getattr(settings, 'API_SCHEMA_DIR', settings.BASE_DIR / 'schema'))
+
+
+def generate_schema():
+    # Генератор и кодеки тянут swagger_spec_validator и jsonschema (~70 мс импорта) — только здесь
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    # Без запроса: публичная схема без host, клиент подставляет адрес, с которого её получил
+    schema = OpenAPISchemaGenerator(INFO).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def _write(path, content):
+    # Через временный файл и os.replace: соседний процесс не прочитает недописанную схему
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+        file.write(content)
+    os.replace(file.name, path)
+
+
+def write_artifact(version):
+    directory = get_schema_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    content = generate_schema()
+    path = directory / f'openapi-{version}.json'
+    _write(path, content)
+    _write(path.with_suffix('.json.gz'), gzip.compress(content, mtime=0))
+    return path
+
+
+def get_artifact():
+    """(json, json.gz, версия) текущей версии кода: из памяти процесса, с диска или сгенерированные."""
+    version = get_schema_version()
+    if version not in _artifacts:
+        with _lock:
+            if version not in _artifacts:
+                path = get_schema_dir() / f'openapi-{version}.json'
+                if not path.exists() or not path.with_suffix('.json.gz').exists():
+                    write_artifact(version)
+                _artifacts.clear()
+                _artifacts[version] = (path.read_bytes(), path.with_suffix('.json.gz').read_bytes(), version)
+    return _artifacts[version]
+
+
+def accepts_gzip(accept_encoding):
+    # q=0 означает «нельзя» (RFC 9110, 12.5.3): 'gzip;q=0' gzip не разрешает, '*' разрешает
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+@require_safe
+def openapi_schema(request):
+    content, compressed, version = get_artifact()
+    # У сжатого представления свой ETag: это другие байты
+    use_gzip = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+    etag = f'"{version}-gzip"' if use_gzip else f'"{version}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if_none_match = [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+    if etag in if_none_match:
+        return HttpResponseNotModified(headers=headers)
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return HttpResponse(compressed if use_gzip else content, content_type='application/json', headers=headers)
+
+
+@lru_cache(maxsize=None)
+def get_ui(renderer):
+    from drf_yasg.views import UI_RENDERERS, get_schema_view
+
+    schema_view = get_schema_view(INFO, public=True, permission_classes=(permissions.AllowAny,))
+    return schema_view.as_cached_view(renderer_classes=UI_RENDERERS[renderer])
+
+
+def ui_view(renderer):
+    # Рендереры drf_yasg загружаются при первом открытии страницы, а не при старте процесса
+    def view(request, *args, **kwargs):
+        # Старые ссылки /swagger/?format=openapi получают готовый документ, а не генерацию
+        if request.GET.get('format') == 'openapi':
+            return openapi_schema(request)
+        return get_ui(renderer)(request, *args, **kwargs)
+    return view
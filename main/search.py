@@ -0,0 +1,117 @@
+"""
+Полнотекстовый поиск по постерам на SQLite FTS5.
+
+Индекс — отдельная FTS5-таблица main_poster_fts (rowid = Poster.id) со своей копией
+title/description/text. Она обновляется сигналами Poster (main.signals) и пересобирается
+командой rebuild_poster_search. Для русского текста используется токенизатор unicode61
+(регистр, диакритика) плюс «ё» -> «е» и отсечение типичных окончаний с префиксным поиском.
+"""
+import re
+
+from django.db import connection
+
+from .models import Poster
+
+FTS_TABLE = 'main_poster_fts'
+# Веса bm25 для колонок title, description, text
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+SNIPPET_TOKENS = 16
+
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ой', 'ей', 'ий', 'ый', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ом', 'ем', 'ую', 'юю',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+), key=len, reverse=True)
+WORD = re.compile(r'\w+')
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def normalize(value):
+    return (value or '').replace('ё', 'е').replace('Ё', 'Е')
+
+
+def stem(word):
+    word = normalize(word).lower()
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def build_match_query(query):
+    # Каждое слово — префиксный запрос по основе: «тренировки» найдёт «тренировка», «тренировкой»...
+    terms = [stem(word) for word in WORD.findall(query)]
+    return ' AND '.join(f'"{term}"*' for term in terms if term)
+
+
+def index_poster(poster):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [poster.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, text) VALUES (%s, %s, %s, %s)',
+            [poster.pk, normalize(poster.title), normalize(poster.description), normalize(poster.text)],
+        )
+
+
+def remove_poster(pk):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        count = 0
+        for poster in Poster.objects.only('id', 'title', 'description', 'text').iterator(chunk_size=500):
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, text) VALUES (%s, %s, %s, %s)',
+                [poster.pk, normalize(poster.title), normalize(poster.description), normalize(poster.text)],
+            )
+            count += 1
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def search_posters(query, limit, after=None):
+    """
+    Постеры по релевантности bm25 с атрибутами rank и snippet (совпадения в <mark>).
+    after — ключ (rank, id) последнего постера предыдущей страницы: выдача продолжается после него.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    if not is_available():
+        posters = Poster.objects.filter(text__icontains=query).order_by('id')
+        if after is not None:
+            posters = posters.filter(id__gt=after[1])
+        posters = list(posters[:limit])
+        for poster in posters:
+            poster.rank, poster.snippet = None, None
+        return posters
+
+    weights = ', '.join(map(str, BM25_WEIGHTS))
+    rank = f'bm25({FTS_TABLE}, {weights})'
+    where, params = f'{FTS_TABLE} MATCH %s', [match]
+    if after is not None:
+        # rowid разрешает равные ранги, так что ключ однозначен и страницы не пересекаются
+        where += f' AND ({rank} > %s OR ({rank} = %s AND rowid > %s))'
+        params += [after[0], after[0], after[1]]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, {rank} AS rank, "
+            f"snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) "
+            f"FROM {FTS_TABLE} WHERE {where} ORDER BY rank, rowid LIMIT %s",
+            [*params, limit],
+        )
+        rows = cursor.fetchall()
+    posters = Poster.objects.in_bulk([row[0] for row in rows])
+    results = []
+    for pk, rank, snippet in rows:
+        if pk in posters:
+            poster = posters[pk]
+            poster.rank, poster.snippet = rank, snippet
+            results.append(poster)
+    return results
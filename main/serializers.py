@@ -1,19 +1,39 @@
+from django.conf import settings
 from django.contrib.auth import authenticate
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
-from .models import Poster, UserProfile, Gym, User, Image, Location, Schedule
+from .derivatives import get_srcset
+from .hashing import hash_password
+from .models import Poster, UserProfile, Gym, User, Image, Location, Schedule, Upload, WeeklyGrid
+from .shaping import DynamicFieldsMixin
+from .uploads import DeduplicatedImageField, UploadTooLarge, get_max_size, too_large_message
+
+# Уменьшенные копии изображения (main.derivatives) в виде srcset по форматам
+class SrcsetField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return get_srcset(value, request.build_absolute_uri if request else None)
 
 # Сериализатор для модели Poster
-class PosterSerializer(serializers.ModelSerializer):
-    picture = serializers.ImageField(use_url=True)
+class PosterSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    picture = DeduplicatedImageField(use_url=True)
+    picture_srcset = SrcsetField(source='picture')
 
     class Meta:
         model = Poster
-        fields = ['id', 'picture', 'title', 'description', 'text']
+        fields = ['id', 'picture', 'picture_srcset', 'title', 'description', 'text']
         read_only_fields = ['publish_date']
 
+# Результат полнотекстового поиска: фрагмент с подсветкой и релевантность bm25 (меньше — лучше)
+class PosterSearchSerializer(PosterSerializer):
+    snippet = serializers.CharField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(PosterSerializer.Meta):
+        fields = PosterSerializer.Meta.fields + ['snippet', 'rank']
+
 # Базовый сериализатор для пользователя, исключающий чувствительные данные
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'first_name', 'last_name', 'email']
@@ -35,9 +55,9 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             username=validated_data['username'],
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
-            email=validated_data['email']
+            email=validated_data['email'],
+            password=hash_password(validated_data['password'])
         )
-        user.set_password(validated_data['password'])
         user.save()
         UserProfile.objects.get_or_create(user=user)  # Изменено для предотвращения дублирования
         Token.objects.create(user=user)
@@ -49,58 +69,61 @@ class UserLoginSerializer(serializers.Serializer):
     password = serializers.CharField(required=True)
 
     def validate(self, data):
-        user = authenticate(username=data['username'], password=data['password'])
+        user = authenticate(self.context.get('request'), username=data['username'], password=data['password'])
         if user:
             return {'user': user}
         raise serializers.ValidationError("Incorrect Credentials")
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     image = serializers.ImageField()
+    image_srcset = SrcsetField(source='image')
 
     class Meta:
         model = Image
-        fields = ['image']
+        fields = ['image', 'image_srcset']
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Location
         fields = ['latitude', 'longitude', 'address']
 
-# Сериализатор для объектов Gym
-class GymSerializer(serializers.ModelSerializer):
+class GymWithoutUsersSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     location = LocationSerializer()
     pictures = ImageSerializer(many=True, read_only=True)
-    users = serializers.SerializerMethodField()
 
     class Meta:
         model = Gym
-        fields = ['slug', 'name', 'pictures', 'description', 'location', 'users']
-
-    def get_users(self, obj):
-        users = obj.users.all()
-        return UserProfileSerializer(users, many=True, context=self.context).data
+        fields = ['slug', 'name', 'pictures', 'description', 'location', 'members_count']
+        expandable_fields = ['pictures']
 
-class GymWithoutUsersSerializer(serializers.ModelSerializer):
-    location = LocationSerializer()
-    pictures = ImageSerializer(many=True, read_only=True)
+class NearbyGymSerializer(GymWithoutUsersSerializer):
+    distance = serializers.FloatField(read_only=True)
 
-    class Meta:
-        model = Gym
-        fields = ['slug', 'name', 'pictures', 'description', 'location']
+    class Meta(GymWithoutUsersSerializer.Meta):
+        fields = GymWithoutUsersSerializer.Meta.fields + ['distance']
 
 # Сериализатор для профилей пользователей
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    avatar = serializers.ImageField(required=False, allow_null=True)
+    avatar = DeduplicatedImageField(required=False, allow_null=True)
+    avatar_srcset = SrcsetField(source='avatar')
     gyms = GymWithoutUsersSerializer(many=True, read_only=True)
 
     class Meta:
         model = UserProfile
-        fields = ['id', 'user', 'avatar', 'phone_number', 'description', 'gyms', 'is_staff', 'group_number']
+        fields = ['id', 'user', 'avatar', 'avatar_srcset', 'phone_number', 'description', 'gyms', 'gyms_count',
+                  'is_staff', 'group_number']
+        expandable_fields = ['gyms']
 
+# Сериализатор для объектов Gym
+class GymSerializer(GymWithoutUsersSerializer):
+    users = UserProfileSerializer(many=True, read_only=True)
 
+    class Meta(GymWithoutUsersSerializer.Meta):
+        fields = GymWithoutUsersSerializer.Meta.fields + ['users']
+        expandable_fields = ['pictures', 'users']
 
-class ScheduleItemSerializer(serializers.ModelSerializer):
+class ScheduleItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserProfileSerializer()
     club = GymSerializer()
 
@@ -108,6 +131,43 @@ class ScheduleItemSerializer(serializers.ModelSerializer):
         model = Schedule
         fields = ['group', 'address', 'club', 'user']
 
+# Пакетное создание расписания (main.scheduling): явный список занятий или правило повторения
+class ScheduleBulkItemSerializer(serializers.Serializer):
+    group = serializers.IntegerField()
+    address = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    club = serializers.SlugField()
+    user = serializers.IntegerField()
+    timestamp = serializers.DateTimeField()
+
+class ScheduleRecurrenceSerializer(serializers.Serializer):
+    group = serializers.IntegerField()
+    address = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    club = serializers.SlugField()
+    user = serializers.IntegerField()
+    weekday = serializers.IntegerField(min_value=0, max_value=6, help_text='0 — понедельник')
+    hour = serializers.IntegerField(min_value=0, max_value=23)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate(self, data):
+        if data['end_date'] < data['start_date']:
+            raise serializers.ValidationError('Дата окончания раньше даты начала.')
+        if (data['end_date'] - data['start_date']).days > 366:
+            raise serializers.ValidationError('Правило повторения не может быть длиннее года.')
+        return data
+
+class ScheduleBulkSerializer(serializers.Serializer):
+    items = ScheduleBulkItemSerializer(many=True, required=False)
+    recurrence = ScheduleRecurrenceSerializer(required=False)
+
+    def validate(self, data):
+        if ('items' in data) == ('recurrence' in data):
+            raise serializers.ValidationError('Нужно передать либо items, либо recurrence.')
+        max_items = getattr(settings, 'SCHEDULE_BULK_MAX_ITEMS', 5000)
+        if len(data.get('items', [])) > max_items:
+            raise serializers.ValidationError(f'Не больше {max_items} занятий за запрос.')
+        return data
+
 class DailyScheduleSerializer(serializers.Serializer):
     time = serializers.IntegerField()
     event = ScheduleItemSerializer(allow_null=True)
@@ -120,3 +180,70 @@ class WeeklyScheduleSerializer(serializers.Serializer):
     friday = serializers.DictField(child=DailyScheduleSerializer(), allow_null=True)
     saturday = serializers.DictField(child=DailyScheduleSerializer(), allow_null=True)
     sunday = serializers.DictField(child=DailyScheduleSerializer(), allow_null=True)
+
+
+# Компактный режим недельного расписания: слоты ссылаются на клубы и пользователей по id,
+# а сами объекты выводятся один раз в таблицах clubs/users
+class CompactGymSerializer(GymWithoutUsersSerializer):
+    class Meta(GymWithoutUsersSerializer.Meta):
+        fields = ['id'] + GymWithoutUsersSerializer.Meta.fields
+
+class CompactUserProfileSerializer(UserProfileSerializer):
+    gyms = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+# Узел иерархии тренер -> ученик (main.hierarchy): depth — расстояние от запрошенного профиля
+class HierarchyProfileSerializer(CompactUserProfileSerializer):
+    depth = serializers.IntegerField(read_only=True)
+
+    class Meta(CompactUserProfileSerializer.Meta):
+        fields = CompactUserProfileSerializer.Meta.fields + ['depth']
+
+class CompactScheduleItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    club = serializers.PrimaryKeyRelatedField(read_only=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = Schedule
+        fields = ['group', 'address', 'club', 'user']
+
+# Инкрементальная синхронизация (main.sync): связи по id, как в компактном расписании
+class SyncScheduleItemSerializer(CompactScheduleItemSerializer):
+    class Meta(CompactScheduleItemSerializer.Meta):
+        fields = ['id', 'timestamp'] + CompactScheduleItemSerializer.Meta.fields
+
+class CompactDailyScheduleSerializer(serializers.Serializer):
+    time = serializers.IntegerField()
+    event = CompactScheduleItemSerializer(allow_null=True)
+
+class CompactWeeklyGridSerializer(serializers.Serializer):
+    monday = serializers.DictField(child=CompactDailyScheduleSerializer(), allow_null=True)
+    tuesday = serializers.DictField(child=CompactDailyScheduleSerializer(), allow_null=True)
+    wednesday = serializers.DictField(child=CompactDailyScheduleSerializer(), allow_null=True)
+    thursday = serializers.DictField(child=CompactDailyScheduleSerializer(), allow_null=True)
+    friday = serializers.DictField(child=CompactDailyScheduleSerializer(), allow_null=True)
+    saturday = serializers.DictField(child=CompactDailyScheduleSerializer(), allow_null=True)
+    sunday = serializers.DictField(child=CompactDailyScheduleSerializer(), allow_null=True)
+
+class CompactWeeklyScheduleSerializer(serializers.Serializer):
+    schedule = CompactWeeklyGridSerializer()
+    clubs = serializers.DictField(child=CompactGymSerializer())
+    users = serializers.DictField(child=CompactUserProfileSerializer())
+
+# Компактная неделя из материализованной сетки (main.grid): слоты хранятся уже в виде ответа
+class CompactWeeklyGridScheduleSerializer(CompactWeeklyScheduleSerializer):
+    schedule = serializers.DictField()
+
+# Сессия возобновляемой загрузки (main.uploads)
+class UploadSerializer(serializers.ModelSerializer):
+    complete = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'filename', 'size', 'offset', 'complete', 'created_at']
+        read_only_fields = ['offset', 'created_at']
+
+    def validate_size(self, value):
+        # Объявленный размер проверяется до приёма первой части
+        if value > get_max_size():
+            raise UploadTooLarge({'size': [too_large_message()]})
+        return value
@@ -0,0 +1,124 @@
+"""
+Разреженные ответы API: ?fields= выбирает поля, ?expand= включает вложенные связи.
+
+    /api/gyms/?fields=slug,name,users.user,users.avatar&expand=users
+
+Поля вложенных объектов задаются через точку, expand тоже может быть вложенным (users.gyms).
+Связи из Meta.expandable_fields в разреженном ответе выводятся только по expand; без обоих
+параметров ответ остаётся полным, как раньше.
+
+По полям, оставшимся в сериализаторе после отбора, строится запрос: only() по нужным столбцам,
+select_related и Prefetch только для запрошенных связей, так что лишнее из БД не читается.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_paths(value):
+    """'slug,users.user,users.avatar' -> {'slug': {}, 'users': {'user': {}, 'avatar': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def get_shape(query_params):
+    fields = query_params.get('fields')
+    expand = query_params.get('expand')
+    if fields is None and expand is None:
+        return {}
+    return {'fields': parse_paths(fields) if fields else None, 'expand': parse_paths(expand or '')}
+
+
+class DynamicFieldsMixin:
+    """Для ModelSerializer: принимает fields/expand (деревья из parse_paths) и оставляет только их."""
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shape = None
+        if fields is not None or expand is not None:
+            self.apply_shape(fields, expand or {})
+
+    def apply_shape(self, fields, expand):
+        self.shape = (fields, expand)
+        expandable = getattr(self.Meta, 'expandable_fields', ())
+        for name in list(self.fields):
+            if (fields and name not in fields) or (name in expandable and name not in expand):
+                self.fields.pop(name)
+                continue
+            field = self.fields[name]
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, DynamicFieldsMixin):
+                nested.apply_shape((fields or {}).get(name) or None, expand.get(name, {}))
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, required=(), **shape):
+        # Загружаем всё дерево сериализатора фиксированным числом запросов и только нужные столбцы
+        only, select, prefetch = {*required}, [], []
+        _collect(cls(**shape), queryset.model, '', only, select, prefetch)
+        return queryset.only(*only).select_related(*select).prefetch_related(*prefetch)
+
+
+def _collect(serializer, model, prefix, only, select, prefetch):
+    only.add(prefix + model._meta.pk.name)
+    for field in serializer.fields.values():
+        source = field.source
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            # Аннотации (distance, rank) и свойства модели
+            continue
+        nested = getattr(field, 'child', field)
+
+        if model_field.many_to_many or model_field.one_to_many:
+            related_model = model_field.related_model
+            if isinstance(nested, serializers.ModelSerializer):
+                inner_only, inner_select, inner_prefetch = set(), [], []
+                _collect(nested, related_model, '', inner_only, inner_select, inner_prefetch)
+                if model_field.one_to_many:
+                    inner_only.add(model_field.field.attname)
+                queryset = related_model._default_manager.only(*inner_only).select_related(
+                    *inner_select).prefetch_related(*inner_prefetch)
+            else:
+                # PrimaryKeyRelatedField(many=True): нужны только id
+                queryset = related_model._default_manager.only(related_model._meta.pk.name)
+            prefetch.append(Prefetch(prefix + source, queryset=queryset))
+        elif model_field.is_relation and isinstance(nested, serializers.ModelSerializer):
+            if model_field.concrete:
+                only.add(prefix + source)
+            select.append(prefix + source)
+            _collect(nested, model_field.related_model, prefix + source + '__', only, select, prefetch)
+        elif model_field.concrete:
+            only.add(prefix + source)
+
+
+class DynamicFieldsViewMixin:
+    """Для DRF-viewset: форма ответа из ?fields=/?expand= для сериализатора и запроса при чтении."""
+    shaped_actions = ('list', 'retrieve')
+
+    def get_shape(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return {}
+        return get_shape(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.shaped_actions:
+            kwargs.update(self.get_shape())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.action not in self.shaped_actions or not issubclass(serializer_class, DynamicFieldsMixin):
+            return queryset
+        # Поля сортировки курсорной пагинации нужны для построения курсора
+        ordering = getattr(self.pagination_class, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        required = [name.lstrip('-') for name in ordering]
+        return serializer_class.setup_eager_loading(queryset, required=required, **self.get_shape())
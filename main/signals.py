@@ -0,0 +1,224 @@
+from contextvars import ContextVar
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .authentication import bump_user_generation, token_cache
+from .cache import bump_version
+from .derivatives import schedule_derivatives
+from . import grid, hierarchy, search
+from .models import Gym, Image, Location, Membership, Poster, Schedule, Tombstone, UserProfile
+
+CACHED_MODELS = (Poster, Gym, Image, Location, UserProfile, Schedule)
+
+
+def invalidate_model_cache(sender, **kwargs):
+    bump_version(sender._meta.label)
+
+
+for model in CACHED_MODELS:
+    post_save.connect(invalidate_model_cache, sender=model, dispatch_uid=f'cache-save-{model._meta.label}')
+    post_delete.connect(invalidate_model_cache, sender=model, dispatch_uid=f'cache-delete-{model._meta.label}')
+
+
+@receiver(m2m_changed, dispatch_uid='cache-m2m')
+def invalidate_m2m_cache(sender, instance, action, model, **kwargs):
+    if not action.startswith('post_'):
+        return
+    # Изменение связи затрагивает обе стороны: gym.users / userprofile.gyms, gym.pictures и т.д.
+    for changed in (type(instance), model):
+        if changed in CACHED_MODELS:
+            bump_version(changed._meta.label)
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='cache-user')
+def invalidate_user_cache(sender, **kwargs):
+    # Имя и почта пользователя выводятся внутри UserProfileSerializer
+    bump_version(UserProfile._meta.label)
+
+
+@receiver(post_delete, sender=Token, dispatch_uid='token-cache-delete')
+def evict_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+    # Остальные воркеры сверяют поколение пользователя при каждом запросе
+    bump_user_generation(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='token-cache-user')
+def evict_user_tokens(sender, instance, **kwargs):
+    # Деактивация, смена пароля или данных пользователя — закэшированный объект устарел
+    token_cache.delete_user(instance.pk)
+    bump_user_generation(instance.pk)
+
+
+IMAGE_FIELDS = {Poster: 'picture', Image: 'image', UserProfile: 'avatar'}
+
+
+def generate_image_derivatives(sender, instance, **kwargs):
+    field_file = getattr(instance, IMAGE_FIELDS[sender])
+    if field_file:
+        transaction.on_commit(lambda: schedule_derivatives(field_file))
+
+
+for model in IMAGE_FIELDS:
+    post_save.connect(generate_image_derivatives, sender=model, dispatch_uid=f'derivatives-{model._meta.label}')
+
+
+@receiver(post_save, sender=Poster, dispatch_uid='poster-search-index')
+def index_poster(sender, instance, **kwargs):
+    if search.is_available():
+        search.index_poster(instance)
+
+
+@receiver(post_delete, sender=Poster, dispatch_uid='poster-search-remove')
+def remove_poster_from_index(sender, instance, **kwargs):
+    if search.is_available():
+        search.remove_poster(instance.pk)
+
+
+# Отслеживание изменений для ?since= (main.sync). updated_at ставит сам save(); здесь — удаления
+# и изменения связанных объектов, которые входят в представление синхронизации
+SYNCED_MODELS = (Poster, Gym, UserProfile, Schedule)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(model=sender._meta.label, object_id=instance.pk)
+
+
+for model in SYNCED_MODELS:
+    post_delete.connect(record_tombstone, sender=model, dispatch_uid=f'sync-tombstone-{model._meta.label}')
+
+
+def touch(queryset):
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Location, dispatch_uid='sync-location')
+def touch_location_gym(sender, instance, **kwargs):
+    touch(Gym.objects.filter(location=instance))
+
+
+@receiver([post_save, pre_delete], sender=Image, dispatch_uid='sync-image')
+def touch_image_gyms(sender, instance, **kwargs):
+    touch(Gym.objects.filter(pictures=instance))
+
+
+@receiver(post_save, sender=User, dispatch_uid='sync-user')
+def touch_user_profile(sender, instance, created, **kwargs):
+    if not created:
+        touch(UserProfile.objects.filter(user=instance))
+
+
+@receiver(pre_delete, sender=Gym, dispatch_uid='sync-gym-members')
+def touch_gym_members(sender, instance, **kwargs):
+    # Удалённый зал пропадает из списков gyms у его участников
+    touch(UserProfile.objects.filter(gyms=instance))
+
+
+@receiver(m2m_changed, dispatch_uid='sync-m2m')
+def touch_m2m(sender, instance, action, model, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if type(instance) in SYNCED_MODELS:
+        touch(type(instance).objects.filter(pk=instance.pk))
+    if model in SYNCED_MODELS and pk_set:
+        touch(model.objects.filter(pk__in=pk_set))
+
+
+# Материализованная недельная сетка (main.grid): пересчитываются только слоты, которые занятие
+# покидает и занимает, — и в сетке клуба, и в сетке тренера
+@receiver(pre_save, sender=Schedule, dispatch_uid='grid-previous-slot')
+def remember_grid_slot(sender, instance, **kwargs):
+    instance._grid_previous = None
+    if instance.pk:
+        instance._grid_previous = Schedule.objects.filter(pk=instance.pk).values_list(
+            'club_id', 'user_id', 'timestamp').first()
+
+
+def refresh_grid_slots(*positions):
+    slots = set()
+    for club_id, user_id, timestamp in filter(None, positions):
+        slots.add(('club', club_id, grid.slot_start(timestamp)))
+        slots.add(('user', user_id, grid.slot_start(timestamp)))
+    for owner, owner_id, start in slots:
+        grid.refresh_slot(owner, owner_id, start)
+
+
+@receiver(post_save, sender=Schedule, dispatch_uid='grid-save')
+def update_grid_on_save(sender, instance, **kwargs):
+    refresh_grid_slots(getattr(instance, '_grid_previous', None),
+                       (instance.club_id, instance.user_id, instance.timestamp))
+
+
+@receiver(post_delete, sender=Schedule, dispatch_uid='grid-delete')
+def update_grid_on_delete(sender, instance, **kwargs):
+    refresh_grid_slots((instance.club_id, instance.user_id, instance.timestamp))
+
+
+# Членство (Membership): счётчики members_count/gyms_count пересчитываются в той же транзакции.
+# gym.users.add/remove/clear шлют m2m_changed — по нему счётчики пересчитываются одним запросом
+# на всю пачку. remove/clear при этом удаляют строки через QuerySet.delete(), который шлёт ещё
+# и post_delete по каждой строке: такие строки помечаются в pre_remove/pre_clear и пропускаются.
+# Прямые Membership.objects.create/delete и каскадные удаления считаются по строке
+_bulk_removed = ContextVar('membership_bulk_removed', default=None)
+
+
+def membership_pairs(instance, pk_set):
+    if isinstance(instance, Gym):
+        return {(instance.pk, pk) for pk in pk_set}
+    return {(pk, instance.pk) for pk in pk_set}
+
+
+@receiver(m2m_changed, sender=Membership, dispatch_uid='membership-m2m')
+def count_m2m_memberships(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_remove' and pk_set:
+        _bulk_removed.set(membership_pairs(instance, pk_set))
+        return
+    if action == 'pre_clear':
+        related = 'gym' if isinstance(instance, Gym) else 'profile'
+        _bulk_removed.set(set(Membership.objects.filter(**{related: instance}).values_list('gym_id', 'profile_id')))
+        return
+    if action == 'post_add' and pk_set:
+        pairs = membership_pairs(instance, pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        pairs = _bulk_removed.get() or set()
+        _bulk_removed.set(None)
+    else:
+        return
+    gym_ids = {gym_id for gym_id, _ in pairs}
+    profile_ids = {profile_id for _, profile_id in pairs}
+    Membership.refresh_counters(gym_ids=gym_ids, profile_ids=profile_ids)
+    if action == 'post_clear':
+        # У clear нет pk_set, поэтому touch_m2m обновит только сам instance
+        touch(Gym.objects.filter(pk__in=gym_ids))
+        touch(UserProfile.objects.filter(pk__in=profile_ids))
+
+
+@receiver([post_save, post_delete], sender=Membership, dispatch_uid='membership-change')
+def count_changed_membership(sender, instance, origin=None, **kwargs):
+    removed = _bulk_removed.get()
+    if isinstance(origin, QuerySet) and removed and (instance.gym_id, instance.profile_id) in removed:
+        return
+    Membership.refresh_counters(gym_ids=[instance.gym_id], profile_ids=[instance.profile_id])
+    touch(Gym.objects.filter(pk=instance.gym_id))
+    touch(UserProfile.objects.filter(pk=instance.profile_id))
+    for model in (Gym, UserProfile):
+        bump_version(model._meta.label)
+
+
+# Иерархия тренер -> ученик должна оставаться ациклической, иначе обход дерева не имеет смысла
+@receiver(m2m_changed, sender=UserProfile.trainees.through, dispatch_uid='hierarchy-cycle')
+def reject_trainee_cycle(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'pre_add' or not pk_set:
+        return
+    # profile.trainers.add(trainer) — та же связь, записанная со стороны ученика
+    cycle = (any(hierarchy.creates_cycle(trainer_id, [instance.pk]) for trainer_id in pk_set) if reverse
+             else hierarchy.creates_cycle(instance.pk, pk_set))
+    if cycle:
+        raise ValidationError('Связь тренер -> ученик образует цикл.')
@@ -0,0 +1,94 @@
+"""
+Профиль холодного старта: STARTUP_PROFILE=1 в окружении manage.py, WSGI или ASGI.
+
+Время импорта каждого модуля (собственное и вместе с вложенными импортами, как у
+python -X importtime, но только для загрузки через importlib) и время от начала профиля
+до завершения первого запроса. Отчёт пишется в stderr после первого ответа; число строк
+задаёт STARTUP_PROFILE_TOP (по умолчанию 30).
+
+Модуль не импортирует Django на уровне модуля: install() вызывается до django.setup().
+"""
+import os
+import sys
+import time
+
+_started = None
+_timer = None
+
+
+class ImportTimer:
+    """Finder в начале sys.meta_path: находит спецификацию остальными finder'ами и замеряет exec_module."""
+
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+        self.total = 0.0
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # Встроенные и замороженные модули загружаются классом-загрузчиком — их не оборачиваем
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+            loader.exec_module = self.wrap(name, loader.exec_module)
+        return spec
+
+    def wrap(self, name, exec_module):
+        def timed_exec_module(module):
+            self.stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                total = time.perf_counter() - started
+                nested = self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += total
+                else:
+                    self.total += total
+                self.times[name] = (total - nested, total)
+        return timed_exec_module
+
+
+def install():
+    global _started, _timer
+    if _timer is not None:
+        return
+    _started = time.perf_counter()
+    _timer = ImportTimer()
+    sys.meta_path.insert(0, _timer)
+
+    from django.core.signals import request_finished
+    request_finished.connect(report_first_request, dispatch_uid='startup-profile')
+
+
+def install_from_env():
+    if os.environ.get('STARTUP_PROFILE'):
+        install()
+
+
+def format_report(timer, elapsed, top=30):
+    lines = [f'Время до первого ответа: {elapsed * 1000:.1f} мс',
+             f'Импортировано модулей: {len(timer.times)}, всего на импорт: {timer.total * 1000:.1f} мс',
+             f'{"собственное, мс":>16} {"с вложенными, мс":>17}  модуль']
+    for name, (own, total) in sorted(timer.times.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+        lines.append(f'{own * 1000:16.1f} {total * 1000:17.1f}  {name}')
+    return '\n'.join(lines) + '\n'
+
+
+def report_first_request(sender, **kwargs):
+    global _timer
+    from django.core.signals import request_finished
+    request_finished.disconnect(dispatch_uid='startup-profile')
+    if _timer is None:
+        return
+    elapsed = time.perf_counter() - _started
+    sys.meta_path.remove(_timer)
+    sys.stderr.write(format_report(_timer, elapsed, int(os.environ.get('STARTUP_PROFILE_TOP', 30))))
+    _timer = None
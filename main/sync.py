@@ -0,0 +1,111 @@
+"""
+Инкрементальная синхронизация: ?since=<cursor> на списках постеров, залов, профилей и расписания.
+
+Ответ содержит объекты, изменённые после курсора (по индексу (updated_at, id)), id удалённых
+объектов из журнала Tombstone и новый курсор. Первый запрос — ?since=0: всё содержимое без
+удалений. Если has_more, клиент сразу запрашивает следующую порцию с новым курсором.
+
+Изменения последних SYNC_SETTLE_SECONDS секунд не отдаются: транзакция, начатая раньше,
+может зафиксироваться позже и иначе проскочила бы мимо курсора. Курсор старше срока хранения
+журнала удалений (SYNC_TOMBSTONE_RETENTION_DAYS) недействителен — клиент получает 410 и
+загружает данные заново.
+"""
+import base64
+import binascii
+import datetime
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .metrics import timed
+from .models import Tombstone
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_settled_time():
+    return timezone.now() - datetime.timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 2))
+
+
+def encode_cursor(updated_at, pk, tombstone_id, issued_at):
+    raw = f'{updated_at.isoformat()}|{pk}|{tombstone_id}|{issued_at.isoformat()}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        updated_at, pk, tombstone_id, issued_at = raw.split('|')
+        return (datetime.datetime.fromisoformat(updated_at), int(pk), int(tombstone_id),
+                datetime.datetime.fromisoformat(issued_at))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValidationError({'since': 'Некорректный курсор синхронизации.'})
+
+
+def get_changes(queryset, since, limit):
+    """Изменения и удаления после курсора since ('0' — с начала); None, если курсор устарел."""
+    label = queryset.model._meta.label
+    settled = get_settled_time()
+    tombstones = Tombstone.objects.filter(model=label, deleted_at__lte=settled)
+
+    if since in ('', '0'):
+        updated_at, pk, issued_at = EPOCH, 0, settled
+        # Новому клиенту удалять нечего — журнал читаем с текущего конца
+        tombstone_id = tombstones.aggregate(last=Max('id'))['last'] or 0
+    else:
+        updated_at, pk, tombstone_id, issued_at = decode_cursor(since)
+        retention = datetime.timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+        if issued_at < timezone.now() - retention:
+            return None
+
+    changed = list(queryset.filter(
+        Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk),
+        updated_at__lte=settled,
+    ).order_by('updated_at', 'pk')[:limit + 1])
+    deleted = list(tombstones.filter(id__gt=tombstone_id).order_by('id').values_list('id', 'object_id')[:limit + 1])
+    has_more = len(changed) > limit or len(deleted) > limit
+    changed, deleted = changed[:limit], deleted[:limit]
+
+    if changed:
+        updated_at, pk = changed[-1].updated_at, changed[-1].pk
+    if deleted:
+        tombstone_id = deleted[-1][0]
+    return {
+        'changed': changed,
+        'deleted': [object_id for _, object_id in deleted],
+        'cursor': encode_cursor(updated_at, pk, tombstone_id, settled),
+        'has_more': has_more,
+    }
+
+
+class SyncViewMixin:
+    """Для DRF-viewset: list с ?since= отдаёт изменения через sync_serializer_class."""
+    sync_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if since is None:
+            return super().list(request, *args, **kwargs)
+        return self.sync(request, since)
+
+    def is_response_cacheable(self, request):
+        # Ответ зависит от момента запроса (граница SYNC_SETTLE_SECONDS), а не только от версий
+        # моделей: закэшированный, он скрывал бы дозревшие изменения до следующей записи
+        return 'since' not in request.query_params
+
+    def sync(self, request, since):
+        # Фильтры списка (например, ?gym= для расписания) применяются к изменениям, но не к удалениям
+        queryset = self.sync_serializer_class.setup_eager_loading(
+            self.filter_queryset(self.queryset.all()), required=['updated_at'])
+        changes = get_changes(queryset, since, self.paginator.get_page_size(request))
+        if changes is None:
+            return Response({'detail': 'Курсор синхронизации устарел, загрузите данные заново.'},
+                            status=status.HTTP_410_GONE)
+        serializer = timed(self.sync_serializer_class(changes['changed'], many=True,
+                                                      context=self.get_serializer_context()))
+        changes['changed'] = serializer.data
+        return Response(changes)
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TemporaryVersionCacheRunner(DiscoverRunner):
+    """
+    Тесты пишут версии кэша ответов (CACHES['versions']) во временный каталог, а не в
+    BASE_DIR/cache/versions рабочего проекта. Переменная окружения нужна процессам --parallel,
+    которые заново читают настройки.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.version_cache_dir = tempfile.TemporaryDirectory(prefix='versions-')
+        self.previous_env = os.environ.get('DJANGO_VERSION_CACHE_DIR')
+        os.environ['DJANGO_VERSION_CACHE_DIR'] = self.version_cache_dir.name
+        self.caches_override = override_settings(CACHES={
+            **settings.CACHES,
+            'versions': {**settings.CACHES['versions'], 'LOCATION': self.version_cache_dir.name},
+        })
+        self.caches_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches_override.disable()
+        if self.previous_env is None:
+            os.environ.pop('DJANGO_VERSION_CACHE_DIR', None)
+        else:
+            os.environ['DJANGO_VERSION_CACHE_DIR'] = self.previous_env
+        self.version_cache_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
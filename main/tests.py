@@ -1,3 +1,1286 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import sys
+import tempfile
+from io import BytesIO, StringIO
+from urllib.parse import quote, unquote
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_login_failed
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image as PILImage
+from unittest import mock
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from .authentication import token_cache
+from .cache import LRUFileBasedCache, bump_version, check_version_cache, get_version_cache
+from .datagen import generate
+from .derivatives import generate_derivatives, schedule_derivatives
+from . import derivatives, hashing, schema, startup
+from .metrics import registry
+from .models import Gym, Image, Location, Membership, Poster, Schedule, Tombstone, Upload, UserProfile, WeeklyGrid
+from .pagination import IdCursorPagination
+from .sync import EPOCH, encode_cursor
+
+
+class GymQueryCountTests(APITestCase):
+    def create_gym(self, index, members):
+        location = Location.objects.create(latitude=56.8 + index, longitude=60.6, address=f'Адрес {index}')
+        gym = Gym.objects.create(name=f'Gym {index}', location=location)
+        gym.pictures.add(Image.objects.create(image=f'gyms/{index}.png'))
+        for number in range(members):
+            user = User.objects.create(username=f'user_{index}_{number}')
+            user.userprofile.gyms.add(gym)
+        return gym
+
+    def test_list_query_count_does_not_grow(self):
+        self.create_gym(1, members=2)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/gyms/')
+        self.assertEqual(response.status_code, 200)
+
+        for index in range(2, 5):
+            self.create_gym(index, members=5)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/gyms/')
+        gyms = response.data['results']
+        self.assertEqual(len(gyms), 4)
+        self.assertEqual(len(gyms[3]['users']), 5)
+        self.assertEqual(gyms[3]['users'][0]['gyms'][0]['slug'], 'gym-4')
+
+    def test_retrieve_query_count(self):
+        gym = self.create_gym(1, members=10)
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/gyms/{gym.slug}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['users']), 10)
+
+
+class MembershipTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.gym = Gym.objects.create(name='Member Gym', location=Location.objects.create(
+            latitude=56.8, longitude=60.6, address='Адрес'))
+        self.profiles = [User.objects.create(username=f'member_{number}').userprofile for number in range(3)]
+
+    def counters(self):
+        self.gym.refresh_from_db()
+        return self.gym.members_count, [UserProfile.objects.get(pk=profile.pk).gyms_count for profile in self.profiles]
+
+    def test_one_relation_from_both_sides(self):
+        self.profiles[0].gyms.add(self.gym)
+        self.gym.users.add(*self.profiles[1:])
+        self.assertEqual(set(self.gym.users.all()), set(self.profiles))
+        self.assertEqual(list(self.profiles[1].gyms.all()), [self.gym])
+        self.assertEqual(Membership.objects.count(), 3)
+        self.assertEqual(self.counters(), (3, [1, 1, 1]))
+
+    def test_counters_follow_every_write_path(self):
+        self.gym.users.add(*self.profiles)
+        self.gym.users.remove(self.profiles[0])
+        self.assertEqual(self.counters(), (2, [0, 1, 1]))
+
+        Membership.objects.create(profile=self.profiles[0], gym=self.gym)
+        self.profiles.pop(1).user.delete()
+        self.assertEqual(self.counters(), (2, [1, 1]))
+
+        self.gym.users.clear()
+        self.assertEqual(self.counters(), (0, [0, 0]))
+
+    def test_remove_and_clear_refresh_counters_once(self):
+        self.gym.users.add(*self.profiles)
+        with CaptureQueriesContext(connection) as one:
+            self.gym.users.remove(self.profiles[0])
+        with CaptureQueriesContext(connection) as two:
+            self.gym.users.remove(*self.profiles[1:])
+        self.assertEqual(len(two), len(one))
+        self.assertEqual(self.counters(), (0, [0, 0, 0]))
+
+        other = Gym.objects.create(name='Other Gym', location=Location.objects.create(
+            latitude=56.9, longitude=60.6, address='Другой адрес'))
+        self.profiles[0].gyms.add(self.gym, other)
+        updated_at = Gym.objects.get(pk=other.pk).updated_at
+        self.profiles[0].gyms.clear()
+        self.assertEqual(self.counters(), (0, [0, 0, 0]))
+        other.refresh_from_db()
+        self.assertEqual(other.members_count, 0)
+        self.assertGreater(other.updated_at, updated_at)
+
+    def test_membership_changes_reach_cached_gym(self):
+        self.client.get(f'/api/gyms/{self.gym.slug}/')
+        Membership.objects.create(profile=self.profiles[0], gym=self.gym)
+        response = self.client.get(f'/api/gyms/{self.gym.slug}/')
+        self.assertEqual(response.data['members_count'], 1)
+        self.assertEqual(response.data['users'][0]['gyms_count'], 1)
+
+
+class TrainerHierarchyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        # Цепочка head -> 1 -> 2 -> ... -> 7 и второй ученик head
+        self.chain = [User.objects.create(username=f'coach_{number}').userprofile for number in range(8)]
+        for trainer, trainee in zip(self.chain, self.chain[1:]):
+            trainer.trainees.add(trainee)
+        self.side = User.objects.create(username='side_trainee').userprofile
+        self.chain[0].trainees.add(self.side)
+
+    def test_descendants_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/profiles/{self.chain[0].pk}/descendants/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['id'], item['depth']) for item in response.data],
+                         sorted([(self.side.pk, 1)] + [(profile.pk, depth)
+                                                       for depth, profile in enumerate(self.chain) if depth],
+                                key=lambda node: (node[1], node[0])))
+        # Профиль, один рекурсивный обход, профили с пользователями и prefetch залов — при любой глубине
+        self.assertEqual(len(queries), 4)
+
+        response = self.client.get(f'/api/profiles/{self.chain[0].pk}/descendants/', {'depth': 2})
+        self.assertEqual({item['depth'] for item in response.data}, {1, 2})
+        self.assertEqual(len(response.data), 3)
+
+    def test_ancestors_and_subtree(self):
+        response = self.client.get(f'/api/profiles/{self.chain[3].pk}/ancestors/')
+        self.assertEqual([item['id'] for item in response.data], [profile.pk for profile in self.chain[2::-1]])
+
+        response = self.client.get(f'/api/profiles/{self.chain[0].pk}/subtree/')
+        self.assertEqual(response.data, {'profile': self.chain[0].pk, 'descendants': 8, 'levels': 7})
+        response = self.client.get(f'/api/profiles/{self.side.pk}/subtree/')
+        self.assertEqual(response.data['descendants'], 0)
+
+    def test_hierarchy_changes_invalidate_cache(self):
+        self.client.get(f'/api/profiles/{self.chain[0].pk}/subtree/')
+        self.side.trainees.add(User.objects.create(username='new_trainee').userprofile)
+        response = self.client.get(f'/api/profiles/{self.chain[0].pk}/subtree/')
+        self.assertEqual(response.data['descendants'], 9)
+
+    def test_cycles_are_rejected(self):
+        # add() пишет в транзакции без точки сохранения — откат ограничиваем своим atomic
+        for add in (lambda: self.chain[7].trainees.add(self.chain[0]),
+                    lambda: self.chain[0].trainers.add(self.chain[5]),
+                    lambda: self.side.trainees.add(self.side)):
+            with self.assertRaises(ValidationError), transaction.atomic():
+                add()
+        self.assertFalse(self.chain[0].trainers.exists())
+        # Несколько тренеров у одного ученика — не цикл
+        self.side.trainers.add(self.chain[6])
+        self.assertEqual(set(self.side.trainers.all()), {self.chain[0], self.chain[6]})
+
+    def test_existing_cycle_does_not_hang_cycle_check(self):
+        # Цикл, созданный в обход сигнала (например, старыми данными)
+        UserProfile.trainees.through.objects.create(from_userprofile=self.chain[7], to_userprofile=self.chain[0])
+        newcomer = User.objects.create(username='newcomer').userprofile
+        self.chain[3].trainees.add(newcomer)
+        self.assertTrue(self.chain[3].trainees.filter(pk=newcomer.pk).exists())
+        with self.assertRaises(ValidationError), transaction.atomic():
+            newcomer.trainees.add(self.chain[5])
+
+    def test_depth_is_validated(self):
+        response = self.client.get(f'/api/profiles/{self.chain[0].pk}/descendants/', {'depth': 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f'/api/profiles/{self.chain[0].pk}/ancestors/', {'depth': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        self.gym = Gym.objects.create(name='Sparse Gym', description='Длинное описание', location=location)
+        self.gym.pictures.add(Image.objects.create(image='gyms/sparse.png'))
+        for number in range(3):
+            user = User.objects.create(username=f'sparse_{number}', first_name='Имя')
+            user.userprofile.gyms.add(self.gym)
+
+    def test_unrequested_columns_and_relations_are_not_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/gyms/', {'fields': 'slug,name'})
+        self.assertEqual(response.data['results'], [{'slug': 'sparse-gym', 'name': 'Sparse Gym'}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0]['sql'])
+
+    def test_nested_relations_are_opt_in(self):
+        response = self.client.get('/api/gyms/', {'fields': 'slug'})
+        self.assertNotIn('users', response.data['results'][0])
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/gyms/', {'fields': 'slug,users.user.first_name,users.avatar',
+                                                      'expand': 'users'})
+        users = response.data['results'][0]['users']
+        self.assertEqual(len(users), 3)
+        self.assertEqual(users[0], {'user': {'first_name': 'Имя'}, 'avatar': None})
+
+    def test_expand_without_fields_keeps_other_fields(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/gyms/{self.gym.slug}/', {'expand': 'users.gyms'})
+        self.assertEqual(response.data['description'], 'Длинное описание')
+        self.assertNotIn('pictures', response.data)
+        self.assertEqual(response.data['users'][0]['gyms'][0]['slug'], 'sparse-gym')
+
+    def test_profiles_list_without_gyms(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/profiles/', {'fields': 'id,user.username,avatar'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'user', 'avatar'})
+
+    def test_profile_update_loads_user_with_profile(self):
+        profile = User.objects.get(username='sparse_0').userprofile
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/api/profiles/{profile.pk}/', {'description': 'Новое'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['username'], 'sparse_0')
+        # Отдельной выборки пользователя по id (ленивой загрузки instance.user) нет
+        lazy_user = f'FROM "auth_user" WHERE "auth_user"."id" = {profile.user_id} LIMIT 21'
+        self.assertFalse([query['sql'] for query in queries if query['sql'].endswith(lazy_user)])
+
+    def test_full_response_without_parameters(self):
+        response = self.client.get(f'/api/gyms/{self.gym.slug}/')
+        self.assertEqual(len(response.data['pictures']), 1)
+        self.assertEqual(len(response.data['users'][0]['gyms']), 1)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class IncrementalSyncTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.posters = [Poster.objects.create(picture='posters/sync.jpg', title=f'Постер {number}', text='Текст')
+                        for number in range(3)]
+
+    def sync(self, url, since, **params):
+        response = self.client.get(url, {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_only_changes_since_cursor_are_returned(self):
+        data = self.sync('/api/blog/', '0')
+        self.assertEqual([poster['title'] for poster in data['changed']], ['Постер 0', 'Постер 1', 'Постер 2'])
+        self.assertEqual(data['deleted'], [])
+
+        with self.assertNumQueries(2):
+            idle = self.sync('/api/blog/', data['cursor'])
+        self.assertEqual((idle['changed'], idle['deleted'], idle['has_more']), ([], [], False))
+
+        self.posters[1].title = 'Новый заголовок'
+        self.posters[1].save()
+        deleted_id = self.posters[2].pk
+        self.posters[2].delete()
+        data = self.sync('/api/blog/', idle['cursor'])
+        self.assertEqual([poster['title'] for poster in data['changed']], ['Новый заголовок'])
+        self.assertEqual(data['deleted'], [deleted_id])
+        self.assertEqual(self.sync('/api/blog/', data['cursor'])['changed'], [])
+
+    def test_pages_follow_cursor(self):
+        first = self.sync('/api/blog/', '0', page_size=2)
+        self.assertTrue(first['has_more'])
+        second = self.sync('/api/blog/', first['cursor'], page_size=2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual([poster['id'] for poster in first['changed'] + second['changed']],
+                         [poster.pk for poster in self.posters])
+
+    def test_related_changes_touch_gym_and_profile(self):
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Старый адрес')
+        gym = Gym.objects.create(name='Sync Gym', location=location)
+        user = User.objects.create(username='syncer')
+        gyms_cursor = self.sync('/api/gyms/', '0')['cursor']
+        profiles_cursor = self.sync('/api/profiles/', '0')['cursor']
+
+        location.address = 'Новый адрес'
+        location.save()
+        user.userprofile.gyms.add(gym)
+        changed = self.sync('/api/gyms/', gyms_cursor)['changed']
+        self.assertEqual(changed[0]['location']['address'], 'Новый адрес')
+        changed = self.sync('/api/profiles/', profiles_cursor)['changed']
+        self.assertEqual(changed[0]['gyms'], [gym.pk])
+
+    def test_schedule_deletes_are_logged(self):
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        gym = Gym.objects.create(name='Sync Gym', location=location)
+        profile = User.objects.create(username='coach').userprofile
+        item = Schedule.objects.create(group=1, address='Адрес', club=gym, user=profile, timestamp=timezone.now())
+        data = self.sync('/api/schedule/', '0')
+        self.assertEqual(data['changed'][0]['club'], gym.pk)
+
+        gym_id, item_id = gym.pk, item.pk
+        gym.delete()
+        data = self.sync('/api/schedule/', data['cursor'])
+        self.assertEqual(data['deleted'], [item_id])
+        self.assertTrue(Tombstone.objects.filter(model='main.Gym', object_id=gym_id).exists())
+
+    def test_settling_changes_are_not_cached(self):
+        cursor = self.sync('/api/blog/', '0')['cursor']
+        Poster.objects.create(picture='posters/sync.jpg', title='Свежий', text='Текст')
+        with self.settings(SYNC_SETTLE_SECONDS=60):
+            self.assertEqual(self.sync('/api/blog/', cursor)['changed'], [])
+        # Запись дозрела, версии моделей не менялись — ответ должен считаться заново
+        self.assertEqual([poster['title'] for poster in self.sync('/api/blog/', cursor)['changed']], ['Свежий'])
+
+    def test_invalid_and_expired_cursors(self):
+        self.assertEqual(self.client.get('/api/blog/', {'since': 'garbage'}).status_code, 400)
+        expired = encode_cursor(EPOCH, 0, 0, timezone.now() - datetime.timedelta(days=31))
+        self.assertEqual(self.client.get('/api/blog/', {'since': expired}).status_code, 410)
+
+
+class ScheduleExportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='ул. Ленина, 1')
+        self.gym = Gym.objects.create(name='Export Gym', location=location)
+        user = User.objects.create(username='coach', first_name='Иван', last_name='Петров')
+        self.profile = user.userprofile
+        start = timezone.make_aware(datetime.datetime(2024, 5, 6, 12))
+        for hour in range(5):
+            Schedule.objects.create(group=hour, address='ул. Ленина, 1', club=self.gym, user=self.profile,
+                                    timestamp=start + datetime.timedelta(days=hour))
+
+    def test_csv_is_streamed(self):
+        response = self.client.get('/api/schedule/export.csv', {'gym': 'export-gym', 'from': '2024-05-07'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,timestamp,group,address,club,club_name,user,username,first_name,last_name')
+        self.assertEqual(len(lines), 5)
+        self.assertIn('"ул. Ленина, 1",export-gym,Export Gym', lines[1])
+
+        self.assertEqual(self.client.get('/api/schedule/export.csv', {'to': 'вчера'}).status_code, 400)
+
+    def test_ical_feed_supports_conditional_get(self):
+        url = f'/api/schedule/user/{self.profile.pk}.ics'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 5)
+        self.assertIn('DTSTART:', body)
+        self.assertIn('LOCATION:ул. Ленина\\, 1\r\n', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        Schedule.objects.filter(group=0).delete()
+        Schedule.objects.create(group=9, address='Адрес', club=self.gym, user=self.profile, timestamp=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_feed(self):
+        self.assertEqual(self.client.get('/api/schedule/club/missing.ics').status_code, 404)
+        response = self.client.get(f'/api/schedule/club/{self.gym.slug}.ics')
+        self.assertIn(b'X-WR-CALNAME:Export Gym', b''.join(response.streaming_content))
+
+
+class WeeklyGridTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        self.gym = Gym.objects.create(name='Grid Gym', location=location)
+        self.other = Gym.objects.create(name='Other Gym', location=Location.objects.create(
+            latitude=56.9, longitude=60.7, address='Другой адрес'))
+        self.profile = User.objects.create(username='grid_coach').userprofile
+        self.monday = timezone.make_aware(datetime.datetime(2024, 5, 6))
+
+    def weekly(self, **params):
+        cache.clear()
+        response = self.client.get('/api/schedule/weekly/', {'week': '2024-W19', 'view': 'compact', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def live_weekly(self, **params):
+        # Без фильтра по одному владельцу ответ строится по живым данным
+        with mock.patch('main.views.ScheduleViewSet.get_grid_owner', return_value=None):
+            return self.weekly(**params)
+
+    def test_slot_is_updated_incrementally(self):
+        event = Schedule.objects.create(group=1, address='Адрес', club=self.gym, user=self.profile,
+                                        timestamp=self.monday + datetime.timedelta(hours=14))
+        Schedule.objects.create(group=2, address='Адрес', club=self.gym, user=self.profile,
+                                timestamp=self.monday + datetime.timedelta(days=1, hours=9))
+        # Сетка — одна строка; остальные запросы — таблицы clubs и users, main_schedule не читается
+        with CaptureQueriesContext(connection) as queries:
+            data = self.weekly(gym=self.gym.slug)
+        self.assertEqual(len(queries), 5)
+        self.assertFalse(any('main_schedule' in query['sql'] for query in queries))
+        self.assertEqual(data['schedule']['monday']['14']['event']['group'], 1)
+        self.assertEqual(data['schedule']['tuesday']['9']['event']['group'], 2)
+        self.assertEqual(data, self.live_weekly(gym=self.gym.slug))
+
+        # Перенос занятия в другой клуб и час освобождает старый слот
+        event.club = self.other
+        event.timestamp += datetime.timedelta(hours=2)
+        event.save()
+        self.assertIsNone(self.weekly(gym=self.gym.slug)['schedule']['monday']['14']['event'])
+        self.assertEqual(self.weekly(gym=self.other.slug)['schedule']['monday']['16']['event']['club'], self.other.pk)
+        self.assertEqual(self.weekly(user=self.profile.pk), self.live_weekly(user=self.profile.pk))
+
+        Schedule.objects.filter(group=2).delete()
+        self.assertNotIn('9', self.weekly(gym=self.gym.slug)['schedule']['tuesday'])
+
+    def test_full_view_from_grid(self):
+        Schedule.objects.create(group=3, address='Адрес', club=self.gym, user=self.profile,
+                                timestamp=self.monday + datetime.timedelta(hours=12))
+        response = self.client.get('/api/schedule/weekly/', {'week': '2024-W19', 'gym': self.gym.slug})
+        event = response.data['monday']['12']['event']
+        self.assertEqual((event['group'], event['club']['slug'], event['user']['id']), (3, 'grid-gym', self.profile.pk))
+
+    def test_week_not_starting_on_monday(self):
+        Schedule.objects.create(group=4, address='Адрес', club=self.gym, user=self.profile,
+                                timestamp=self.monday + datetime.timedelta(days=2, hours=14))
+        data = self.weekly(week='2024-05-08', gym=self.gym.slug)
+        self.assertEqual(data['schedule']['wednesday']['14']['event']['group'], 4)
+
+    def test_consistency_check(self):
+        Schedule.objects.create(group=1, address='Адрес', club=self.gym, user=self.profile,
+                                timestamp=self.monday + datetime.timedelta(hours=13))
+        call_command('check_weekly_grid', stdout=StringIO())
+
+        WeeklyGrid.objects.filter(club=self.gym).update(slots={})
+        with self.assertRaises(CommandError):
+            call_command('check_weekly_grid', stdout=StringIO())
+        call_command('check_weekly_grid', repair=True, stdout=StringIO())
+        call_command('check_weekly_grid', stdout=StringIO())
+
+
+class CompactWeeklyScheduleTests(APITestCase):
+    def test_entities_are_listed_once(self):
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        gym = Gym.objects.create(name='Gym', location=location)
+        trainer = User.objects.create(username='trainer').userprofile
+        for number in range(3):
+            member = User.objects.create(username=f'member_{number}').userprofile
+            gym.users.add(member)
+
+        start = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        start -= datetime.timedelta(days=start.weekday())
+        for day in range(3):
+            Schedule.objects.create(group=1, address=location.address, club=gym, user=trainer,
+                                    timestamp=start + datetime.timedelta(days=day))
+
+        response = self.client.get('/api/schedule/weekly/', {'view': 'compact', 'gym': gym.slug})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['clubs']), [str(gym.id)])
+        self.assertEqual(list(response.data['users']), [str(trainer.id)])
+        self.assertNotIn('users', response.data['clubs'][str(gym.id)])
+
+        events = [slot['event'] for day in response.data['schedule'].values()
+                  for slot in day.values() if slot['event']]
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]['club'], gym.id)
+        self.assertEqual(events[0]['user'], trainer.id)
+
+
+class WeeklyScheduleRangeTests(APITestCase):
+    def setUp(self):
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        self.gym = Gym.objects.create(name='Gym', location=location)
+        self.trainer = User.objects.create(username='trainer').userprofile
+
+    def create_event(self, group, timestamp):
+        return Schedule.objects.create(group=group, address='Адрес', club=self.gym, user=self.trainer,
+                                       timestamp=timezone.make_aware(timestamp))
+
+    def test_week_selects_range(self):
+        # 2024-05-06 — понедельник 19-й ISO-недели
+        self.create_event(1, datetime.datetime(2024, 5, 6, 14))
+        self.create_event(2, datetime.datetime(2024, 5, 13, 14))
+        self.create_event(3, datetime.datetime(2024, 5, 12, 23))
+
+        for week in ('2024-W19', '2024-05-06'):
+            response = self.client.get('/api/schedule/weekly/', {'gym': self.gym.slug, 'week': week})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['monday']['14']['event']['group'], 1)
+            self.assertEqual(response.data['sunday']['23']['event']['group'], 3)
+
+        response = self.client.get('/api/schedule/weekly/', {'gym': self.gym.slug, 'week': '2024-W20'})
+        self.assertEqual(response.data['monday']['14']['event']['group'], 2)
+        self.assertIsNone(response.data['sunday']['12']['event'])
+
+    def test_invalid_week(self):
+        response = self.client.get('/api/schedule/weekly/', {'week': 'next'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('week', response.data)
+
+
+class CursorPaginationTests(APITestCase):
+    def test_blog_pages_newest_first(self):
+        for number in range(5):
+            Poster.objects.create(picture=f'posters/{number}.png', title=f'Пост {number}', text='Текст')
+
+        titles = []
+        url = '/api/blog/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            titles += [poster['title'] for poster in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(titles, [f'Пост {number}' for number in reversed(range(5))])
+
+    def test_page_size_is_capped(self):
+        request = Request(APIRequestFactory().get('/api/profiles/', {'page_size': 10000}))
+        self.assertEqual(IdCursorPagination().get_page_size(request), IdCursorPagination.max_page_size)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = Poster.objects.create(picture='posters/1.png', title='Первый', text='Текст')
+
+    def test_cached_until_model_changes(self):
+        self.client.get('/api/blog/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/blog/')
+        self.assertEqual(response.data['results'][0]['title'], 'Первый')
+
+        self.poster.title = 'Изменён'
+        self.poster.save()
+        response = self.client.get('/api/blog/')
+        self.assertEqual(response.data['results'][0]['title'], 'Изменён')
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_can_be_disabled(self):
+        self.client.get('/api/blog/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/blog/')
+        self.assertNotIn('ETag', response)
+
+    def test_m2m_change_invalidates_gym(self):
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        gym = Gym.objects.create(name='Gym', location=location)
+        self.assertEqual(self.client.get(f'/api/gyms/{gym.slug}/').data['users'], [])
+
+        gym.users.add(User.objects.create(username='member').userprofile)
+        self.assertEqual(len(self.client.get(f'/api/gyms/{gym.slug}/').data['users']), 1)
+
+    def test_conditional_get(self):
+        response = self.client.get(f'/api/blog/{self.poster.pk}/')
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(f'/api/blog/{self.poster.pk}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        Poster.objects.create(picture='posters/2.png', title='Второй', text='Текст')
+        response = self.client.get(f'/api/blog/{self.poster.pk}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_versions_are_shared_between_processes(self):
+        self.client.get('/api/blog/')
+        # Другой воркер: свой кэш ответов в памяти, но общий кэш версий
+        with self.settings(RESPONSE_CACHE_ALIAS='worker'), override_settings(CACHES={
+                **settings.CACHES, 'worker': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                      'LOCATION': 'worker'}}):
+            self.client.get('/api/blog/')
+            self.poster.title = 'Изменён в другом воркере'
+            self.poster.save()
+        response = self.client.get('/api/blog/')
+        self.assertEqual(response.data['results'][0]['title'], 'Изменён в другом воркере')
+
+    def test_warns_about_process_local_versions(self):
+        self.assertEqual(check_version_cache(None), [])
+        with self.settings(RESPONSE_VERSION_CACHE_ALIAS='default'):
+            self.assertEqual([warning.id for warning in check_version_cache(None)], ['main.W001'])
+
+    def test_versions_are_not_written_into_project_during_tests(self):
+        bump_version('main.Poster')
+        directory = os.path.realpath(get_version_cache()._dir)
+        self.assertFalse(directory.startswith(os.path.realpath(settings.BASE_DIR)), directory)
+        self.assertTrue(os.listdir(directory))
+
+    def test_file_cache_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = LRUFileBasedCache(directory, {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}})
+            file_cache.set('a', 1)
+            file_cache.set('b', 2)
+            file_cache.set('c', 3)
+            for name, mtime in (('a', 30), ('b', 10), ('c', 20)):
+                os.utime(file_cache._key_to_file(name), (mtime, mtime))
+            file_cache.set('d', 4)
+            self.assertIsNone(file_cache.get('b'))
+            self.assertEqual([file_cache.get(name) for name in 'acd'], [1, 3, 4])
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = User.objects.create(username='staff', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_second_request_skips_token_query(self):
+        self.client.get('/api/blog/')
+        # Ответ ленты закэширован, так что запросов к БД не остаётся вовсе
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/blog/')
+        self.assertEqual(response.wsgi_request.user, self.user)
+        self.assertEqual(token_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/profiles/')
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/profiles/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/profiles/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/profiles/').status_code, 401)
+
+    def test_changes_in_other_workers_are_seen(self):
+        self.client.get('/api/profiles/')
+        # В другом воркере локальный кэш этого процесса не очищается — только общее поколение
+        with mock.patch.object(token_cache, 'delete_user'), mock.patch.object(token_cache, 'delete'):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/profiles/').status_code, 401)
+
+    def test_requests_get_separate_user_objects(self):
+        first = self.client.get('/api/profiles/').wsgi_request.user
+        second = self.client.get('/api/profiles/').wsgi_request.user
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+
+class ImageDerivativeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        derivatives._scheduled.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_poster_exposes_generated_sizes(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (1000, 500), 'red').save(buffer, format='PNG')
+        name = default_storage.save('posters/poster.png', ContentFile(buffer.getvalue()))
+        poster = Poster.objects.create(picture=name, title='Пост', text='Текст')
+
+        self.assertTrue(generate_derivatives(default_storage, name))
+        with default_storage.open('posters/poster_320w.webp') as derivative:
+            self.assertEqual(PILImage.open(derivative).size, (320, 160))
+        self.assertFalse(default_storage.exists('posters/poster_1280w.webp'))
+
+        srcset = self.client.get(f'/api/blog/{poster.pk}/').data['picture_srcset']
+        self.assertEqual(set(srcset), {'webp', 'png'})
+        self.assertTrue(srcset['webp'].endswith('/media/posters/poster_640w.webp 640w'))
+        self.assertIn('/media/posters/poster_320w.png 320w', srcset['png'])
+
+    def test_srcset_remembers_existing_sizes(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (1000, 500), 'red').save(buffer, format='PNG')
+        name = default_storage.save('posters/remembered.png', ContentFile(buffer.getvalue()))
+        picture = Poster(picture=name).picture
+        self.assertTrue(generate_derivatives(default_storage, name))
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            first = derivatives.get_srcset(picture)
+            self.assertEqual(exists.call_count, 3)
+            self.assertEqual(derivatives.get_srcset(picture), first)
+            self.assertEqual(exists.call_count, 3)
+            # Оригинал заменён под тем же именем — набор копий проверяется заново
+            os.utime(default_storage.path(name), (1, 1))
+            with mock.patch('main.derivatives._generate_and_invalidate'):
+                derivatives.get_srcset(picture)
+            self.assertEqual(exists.call_count, 6)
+
+    def test_srcset_does_not_remember_partial_sizes(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (1000, 500), 'red').save(buffer, format='PNG')
+        name = default_storage.save('posters/partial.png', ContentFile(buffer.getvalue()))
+        picture = Poster(picture=name).picture
+        self.assertTrue(generate_derivatives(default_storage, name))
+        default_storage.delete('posters/partial_640w.webp')
+        self.assertNotIn('640w', derivatives.get_srcset(picture)['webp'])
+        self.assertTrue(generate_derivatives(default_storage, name))
+        self.assertIn('640w', derivatives.get_srcset(picture)['webp'])
+
+    @override_settings(IMAGE_DERIVATIVE_SCHEDULED_MAX=1)
+    def test_rescheduled_for_replaced_file_and_bounded(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (1000, 500), 'red').save(buffer, format='PNG')
+        name = default_storage.save('posters/replaced.png', ContentFile(buffer.getvalue()))
+        picture = Poster(picture=name).picture
+        with mock.patch('main.derivatives._generate_and_invalidate'):
+            self.assertIsNotNone(schedule_derivatives(picture))
+            self.assertIsNone(schedule_derivatives(picture))
+            # Файл заменён под тем же именем — копии строятся заново
+            os.utime(default_storage.path(name), (1, 1))
+            self.assertIsNotNone(schedule_derivatives(picture))
+        self.assertEqual(len(derivatives._scheduled), 1)
+
+
+class ImageUploadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for name in ('MEDIA_ROOT', 'UPLOAD_RESUMABLE_DIR'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            settings_override = override_settings(**{name: directory.name})
+            settings_override.enable()
+            self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(username='staff', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+    def make_image(self, size=(40, 20)):
+        buffer = BytesIO()
+        PILImage.new('RGB', size, 'red').save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def post_poster(self, picture):
+        if isinstance(picture, bytes):
+            picture = ContentFile(picture, name='poster.png')
+        return self.client.post('/api/blog/', {'picture': picture, 'title': 'Пост', 'text': 'Текст'})
+
+    def test_same_image_is_stored_once(self):
+        content = self.make_image()
+        first = self.post_poster(content)
+        second = self.post_poster(content)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        names = set(Poster.objects.values_list('picture', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertRegex(names.pop(), r'^posters/[0-9a-f]{32}\.png$')
+        self.assertEqual(len(default_storage.listdir('posters')[1]), 1)
+
+    @override_settings(UPLOAD_MAX_SIZE=1024)
+    def test_rejects_oversized_body(self):
+        response = self.post_poster(os.urandom(4096))
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Poster.objects.exists())
+
+    @override_settings(UPLOAD_MAX_DIMENSION=100)
+    def test_rejects_large_dimensions(self):
+        response = self.post_poster(self.make_image((200, 10)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('picture', response.data)
+
+    def test_resumable_upload(self):
+        content = self.make_image((300, 300))
+        response = self.client.post('/api/uploads/', {'filename': 'poster.png', 'size': len(content)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        url = f"/api/uploads/{response.data['id']}/"
+        half = len(content) // 2
+
+        def send(offset, data):
+            return self.client.generic('PATCH', url, data, content_type='application/offset+octet-stream',
+                                       HTTP_UPLOAD_OFFSET=str(offset))
+
+        self.assertEqual(send(0, content[:half])['Upload-Offset'], str(half))
+        # Повтор уже принятой части после обрыва: сервер сообщает, откуда продолжать
+        conflict = send(0, content[:half])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict['Upload-Offset'], str(half))
+        self.assertEqual(self.client.get(url)['Upload-Offset'], str(half))
+        self.assertTrue(send(half, content[half:]).data['complete'])
+
+        upload_id = response.data['id']
+        # Ошибка в другом поле не расходует загрузку
+        response = self.client.post('/api/blog/', {'picture': upload_id, 'text': 'Текст'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('title', response.data)
+        self.assertTrue(Upload.objects.filter(pk=upload_id).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.post_poster(upload_id).status_code, 201)
+        with Poster.objects.get().picture.open() as picture:
+            self.assertEqual(picture.read(), content)
+        # Загрузка одноразовая
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(self.post_poster(upload_id).status_code, 400)
+
+        # Повторная загрузка того же содержимого ссылается на имеющийся файл и удаляется целиком
+        response = self.client.post('/api/uploads/', {'filename': 'copy.png', 'size': len(content)}, format='json')
+        url = f"/api/uploads/{response.data['id']}/"
+        send(0, content)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.post_poster(response.data['id']).status_code, 201)
+        self.assertEqual(len(set(Poster.objects.values_list('picture', flat=True))), 1)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_RESUMABLE_DIR), [])
+
+
+class OpenAPISchemaTests(APITestCase):
+    def setUp(self):
+        schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(schema_dir.cleanup)
+        settings_override = override_settings(API_SCHEMA_DIR=schema_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.schema_dir = schema_dir.name
+        schema._artifacts.clear()
+        self.addCleanup(schema._artifacts.clear)
+
+    def test_generated_once_and_served_with_etag(self):
+        with mock.patch('main.schema.generate_schema', wraps=schema.generate_schema) as generate:
+            response = self.client.get('/openapi.json')
+            self.assertEqual(response.status_code, 200)
+            paths = json.loads(response.content)['paths']
+            self.assertIn('/profiles/{id}/descendants/', paths)
+            self.assertEqual(paths['/uploads/{id}/']['parameters'][0]['format'], 'uuid')
+            self.client.get('/openapi.json')
+            self.client.get('/swagger/', {'format': 'openapi'})
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(os.listdir(self.schema_dir).count(f'openapi-{schema.get_schema_version()}.json'), 1)
+
+        response = self.client.get('/openapi.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip(self):
+        plain = self.client.get('/openapi.json')
+        response = self.client.get('/openapi.json', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+
+        for accept_encoding in ('gzip;q=0, deflate', 'br, *;q=0', 'identity, gzip ; q=0.0', 'xgzip'):
+            response = self.client.get('/openapi.json', HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertFalse(response.has_header('Content-Encoding'), accept_encoding)
+            self.assertEqual(response.content, plain.content)
+        for accept_encoding in ('GZIP;q=0.5', 'br, *', 'deflate, x-gzip'):
+            response = self.client.get('/openapi.json', HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(response['Content-Encoding'], 'gzip', accept_encoding)
+
+    def test_artifact_from_build_is_reused(self):
+        call_command('generate_openapi_schema', stdout=StringIO())
+        with mock.patch('main.schema.generate_schema') as generate:
+            response = self.client.get('/openapi.json')
+        self.assertEqual(response.status_code, 200)
+        generate.assert_not_called()
+
+    def test_ui_points_to_artifact(self):
+        response = self.client.get('/swagger/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'/openapi.json', response.content)
+
+
+class StartupProfileTests(APITestCase):
+    def test_import_timer(self):
+        sys.modules.pop('colorsys', None)
+        timer = startup.ImportTimer()
+        sys.meta_path.insert(0, timer)
+        try:
+            import colorsys  # noqa: F401
+        finally:
+            sys.meta_path.remove(timer)
+        own, total = timer.times['colorsys']
+        self.assertLessEqual(own, total)
+        self.assertEqual(timer.total, total)
+        self.assertIn('colorsys', startup.format_report(timer, 0.5))
+
+
+class MediaServingTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.content = bytes(range(256)) * 4
+        default_storage.save('posters/poster.png', ContentFile(self.content))
+
+    def test_full_response_and_not_modified(self):
+        response = self.client.get('/media/posters/poster.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+        response = self.client.get('/media/posters/poster.png', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.client.get('/media/posters/poster.png', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get('/media/posters/poster.png', HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get('/media/posters/poster.png', HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_hashed_names_are_immutable(self):
+        default_storage.save('posters/0123456789abcdef0123.png', ContentFile(b'png'))
+        response = self.client.get('/media/posters/0123456789abcdef0123.png')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_OFFLOAD='x-accel-redirect')
+    def test_offload(self):
+        with mock.patch('main.media._content_hash') as content_hash:
+            response = self.client.get('/media/posters/poster.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/posters/poster.png')
+        self.assertEqual(response.content, b'')
+        # Файл целиком не читается ради ETag
+        content_hash.assert_not_called()
+        response = self.client.get('/media/posters/poster.png', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_offload_quotes_non_ascii_names(self):
+        name = default_storage.save('posters/афиша 1.png', ContentFile(b'png'))
+        url = '/media/' + quote(name)
+        with self.settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + quote(name))
+        with self.settings(MEDIA_OFFLOAD='x-sendfile'):
+            response = self.client.get(url)
+        self.assertEqual(unquote(response['X-Sendfile']), os.path.join(settings.MEDIA_ROOT, name))
+        response['X-Sendfile'].encode('ascii')
+
+    def test_outside_media_root(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/posters/missing.png').status_code, 404)
+
+
+class AsyncReadEndpointTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        self.gym = Gym.objects.create(name='Gym', location=location)
+        trainer = User.objects.create(username='trainer').userprofile
+        trainer.gyms.add(self.gym)
+        Schedule.objects.create(group=1, address='Адрес', club=self.gym, user=trainer,
+                                timestamp=timezone.make_aware(datetime.datetime(2024, 5, 6, 14)))
+        self.poster = Poster.objects.create(picture='posters/1.png', title='Пост', text='Текст')
+
+    async def test_matches_sync_responses(self):
+        for sync_url, async_url in (
+            ('/api/blog/', '/api/async/blog/'),
+            (f'/api/blog/{self.poster.pk}/', f'/api/async/blog/{self.poster.pk}/'),
+            ('/api/gyms/', '/api/async/gyms/'),
+            (f'/api/gyms/{self.gym.slug}/', f'/api/async/gyms/{self.gym.slug}/'),
+            ('/api/schedule/weekly/?week=2024-W19', '/api/async/schedule/weekly/?week=2024-W19'),
+            ('/api/schedule/weekly/?week=2024-W19&view=compact',
+             '/api/async/schedule/weekly/?week=2024-W19&view=compact'),
+        ):
+            expected = (await self.async_client.get(sync_url)).json()
+            response = await self.async_client.get(async_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected, async_url)
+
+    async def test_errors(self):
+        self.assertEqual((await self.async_client.get('/api/async/gyms/missing/')).status_code, 404)
+        self.assertEqual((await self.async_client.get('/api/async/blog/0/')).status_code, 404)
+        response = await self.async_client.get('/api/async/schedule/weekly/?week=next')
+        self.assertEqual(response.status_code, 400)
+        expected = await self.async_client.get('/api/schedule/weekly/?week=2024-W19&user=abc')
+        self.assertEqual(expected.status_code, 400)
+        response = await self.async_client.get('/api/async/schedule/weekly/?week=2024-W19&user=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), expected.json())
+
+
+class SQLitePragmaTests(APITestCase):
+    def test_pragmas_applied_to_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            # Ожидание блокировки задаёт только OPTIONS['timeout'] = 20 с
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+
+class NearbyGymTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for name, latitude, longitude in (
+            ('Center', 56.8380, 60.5975),
+            ('Uralmash', 56.8950, 60.6100),
+            ('Sysert', 56.5000, 60.8100),
+            ('Moscow', 55.7558, 37.6173),
+        ):
+            location = Location.objects.create(latitude=latitude, longitude=longitude, address=name)
+            Gym.objects.create(name=name, location=location)
+
+    def test_sorted_by_distance_within_radius(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/gyms/nearby/', {'lat': 56.84, 'lon': 60.60, 'radius': 50})
+        self.assertEqual([gym['slug'] for gym in response.data], ['center', 'uralmash', 'sysert'])
+        self.assertLess(response.data[0]['distance'], 1)
+        self.assertNotIn('users', response.data[0])
+
+        response = self.client.get('/api/gyms/nearby/', {'lat': 56.84, 'lon': 60.60, 'radius': 50, 'limit': 1})
+        self.assertEqual([gym['slug'] for gym in response.data], ['center'])
+
+    def test_cell_follows_bulk_coordinate_changes(self):
+        Location.objects.filter(address='Moscow').update(latitude=56.85, longitude=60.60)
+        sysert = Location.objects.get(address='Sysert')
+        sysert.latitude, sysert.longitude = 55.7558, 37.6173
+        Location.objects.bulk_update([sysert], ['latitude', 'longitude'])
+        cache.clear()
+        response = self.client.get('/api/gyms/nearby/', {'lat': 56.84, 'lon': 60.60, 'radius': 50})
+        self.assertEqual([gym['slug'] for gym in response.data], ['center', 'moscow', 'uralmash'])
+
+    def test_crosses_antimeridian(self):
+        location = Location.objects.create(latitude=65.0, longitude=-179.95, address='Chukotka')
+        Gym.objects.create(name='Chukotka', location=location)
+        response = self.client.get('/api/gyms/nearby/', {'lat': 65.0, 'lon': 179.95, 'radius': 20})
+        self.assertEqual([gym['slug'] for gym in response.data], ['chukotka'])
+
+    def test_invalid_params(self):
+        response = self.client.get('/api/gyms/nearby/', {'lat': 'north', 'radius': 5000})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'lat', 'lon', 'radius'})
+
+
+class PosterSearchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.boxing = Poster.objects.create(picture='posters/1.png', title='Тренировки по боксу',
+                                            text='Открыт набор в группу для начинающих.')
+        self.yoga = Poster.objects.create(picture='posters/2.png', title='Йога', description='Ёлочная йога',
+                                          text='Утренняя тренировка по субботам в главном зале.')
+
+    def search(self, query):
+        response = self.client.get('/api/blog/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_ranks_title_matches_first(self):
+        results = self.search('тренировка')
+        self.assertEqual([poster['id'] for poster in results], [self.boxing.id, self.yoga.id])
+        self.assertIn('<mark>', results[1]['snippet'])
+
+    def test_russian_forms_and_yo(self):
+        self.assertEqual([poster['id'] for poster in self.search('боксом')], [self.boxing.id])
+        self.assertEqual([poster['id'] for poster in self.search('елочная йога')], [self.yoga.id])
+        self.assertEqual(self.search('плавание'), [])
+
+    def test_index_follows_changes(self):
+        self.yoga.title = 'Плавание'
+        self.yoga.text = 'Бассейн'
+        self.yoga.save()
+        self.assertEqual([poster['id'] for poster in self.search('плавание')], [self.yoga.id])
+        self.boxing.delete()
+        self.assertEqual(self.search('бокс'), [])
+
+    def test_pages_by_rank_cursor(self):
+        extra = [Poster.objects.create(picture='posters/3.png', title='Зал', text='Тренировка') for _ in range(3)]
+        expected = [poster['id'] for poster in self.search('тренировка')]
+        self.assertCountEqual(expected, [self.boxing.id, self.yoga.id] + [poster.id for poster in extra])
+
+        seen, url, params = [], '/api/blog/', {'q': 'тренировка', 'page_size': 2}
+        while url:
+            response = self.client.get(url, params)
+            params = None
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [poster['id'] for poster in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+        response = self.client.get('/api/blog/', {'q': 'тренировка', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_command(self):
+        Poster.objects.filter(pk=self.boxing.pk).update(title='Самбо')
+        call_command('rebuild_poster_search', stdout=StringIO())
+        self.assertEqual([poster['id'] for poster in self.search('самбо')], [self.boxing.id])
+
+
+class BulkScheduleTests(APITestCase):
+    def setUp(self):
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес клуба')
+        self.gym = Gym.objects.create(name='Gym', location=location)
+        other_location = Location.objects.create(latitude=56.9, longitude=60.6, address='Другой адрес')
+        self.other_gym = Gym.objects.create(name='Other', location=other_location)
+        self.trainer = User.objects.create(username='trainer').userprofile
+        self.other_trainer = User.objects.create(username='other').userprofile
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+
+    def item(self, hour, club=None, user=None, day=6):
+        return {
+            'group': 1,
+            'club': (club or self.gym).slug,
+            'user': (user or self.trainer).id,
+            'timestamp': timezone.make_aware(datetime.datetime(2024, 5, day, hour)).isoformat(),
+        }
+
+    def test_creates_batch(self):
+        items = [self.item(hour) for hour in range(12, 19)]
+        # клубы, пользователи, существующие занятия, вставка, недельная сетка (занятия недели,
+        # существующие сетки, вставка) + SAVEPOINT/RELEASE транзакции
+        with self.assertNumQueries(9):
+            response = self.client.post('/api/schedule/bulk/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 7})
+        self.assertEqual(Schedule.objects.filter(address='Адрес клуба').count(), 7)
+
+    def test_recurrence(self):
+        rule = {'group': 2, 'club': self.gym.slug, 'user': self.trainer.id, 'weekday': 2, 'hour': 18,
+                'start_date': '2024-05-01', 'end_date': '2024-05-31'}
+        response = self.client.post('/api/schedule/bulk/', {'recurrence': rule}, format='json')
+        self.assertEqual(response.data, {'created': 5})
+        days = sorted(timezone.localtime(ts).day for ts in Schedule.objects.values_list('timestamp', flat=True))
+        self.assertEqual(days, [1, 8, 15, 22, 29])
+
+    def test_conflicts_are_reported_per_item(self):
+        Schedule.objects.create(group=1, address='Адрес', club=self.gym, user=self.other_trainer,
+                                timestamp=timezone.make_aware(datetime.datetime(2024, 5, 6, 12, 30)))
+        items = [
+            self.item(12),
+            self.item(13),
+            self.item(13, club=self.other_gym),
+            self.item(14, user=self.other_trainer),
+            self.item(14),
+            {**self.item(15), 'club': 'missing'},
+        ]
+        response = self.client.post('/api/schedule/bulk/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 2, 4, 5])
+        self.assertIn('timestamp', response.data['errors'][0]['errors'])
+        self.assertIn('user', response.data['errors'][1]['errors'])
+        self.assertIn('позицией 3', response.data['errors'][2]['errors']['timestamp'])
+        self.assertIn('club', response.data['errors'][3]['errors'])
+        self.assertEqual(Schedule.objects.count(), 1)
+
+    def test_requires_items_or_recurrence(self):
+        response = self.client.post('/api/schedule/bulk/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_club_and_trainer_conflicts_are_both_reported(self):
+        response = self.client.post('/api/schedule/bulk/', {'items': [self.item(12), self.item(12)]}, format='json')
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {
+            'timestamp': 'Время в клубе совпадает с позицией 0.', 'user': 'Тренер занят в позиции 0.'}}])
+
+    def test_requires_staff(self):
+        items = [self.item(12)]
+        self.client.force_authenticate(self.trainer.user)
+        self.assertEqual(self.client.post('/api/schedule/bulk/', {'items': items}, format='json').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/api/schedule/bulk/', {'items': items}, format='json').status_code, 401)
+        self.assertFalse(Schedule.objects.exists())
+
+
+class PasswordHashingTests(APITestCase):
+    def test_register_and_login(self):
+        with mock.patch.object(hashing, 'make_password', wraps=hashing.make_password) as make_password:
+            response = self.client.post('/api/auth/register/', {
+                'username': 'athlete', 'password': 'Secret-123', 'first_name': 'Иван',
+                'last_name': 'Петров', 'email': 'ivan@example.com',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(make_password.call_count, 1)
+
+        response = self.client.post('/api/auth/login/', {'username': 'athlete', 'password': 'Secret-123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['token'], Token.objects.get(user__username='athlete').key)
+
+        response = self.client.post('/api/auth/login/', {'username': 'athlete', 'password': 'wrong'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_login_signal(self):
+        User.objects.create_user('athlete', password='Secret-123')
+        failures = []
+
+        def receiver(sender, credentials, **kwargs):
+            failures.append(credentials['username'])
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        response = self.client.post('/api/auth/login/', {'username': 'athlete', 'password': 'wrong'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(failures, ['athlete'])
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher',
+                                         'django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_legacy_hash_is_upgraded_on_login(self):
+        user = User.objects.create(username='legacy', password=make_password('Secret-123', hasher='md5'))
+        response = self.client.post('/api/auth/login/', {'username': 'legacy', 'password': 'Secret-123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('Secret-123'))
+
+    def test_profile_create_writes_user_once(self):
+        with mock.patch.object(User, 'save', autospec=True, side_effect=User.save) as save:
+            response = self.client.post('/api/profiles/', {
+                'username': 'member', 'password': 'Secret-123', 'first_name': 'Анна',
+                'last_name': 'Иванова', 'email': 'anna@example.com', 'phone_number': '+79990000000',
+                'is_staff': 'false',
+            })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(response.data['phone_number'], '+79990000000')
+        self.assertTrue(User.objects.get(username='member').check_password('Secret-123'))
+
+    def test_saturated_pool_returns_429(self):
+        executor, slots = hashing._get_pool()
+        with mock.patch.object(slots, 'acquire', return_value=False):
+            response = self.client.post('/api/auth/login/', {'username': 'nobody', 'password': 'x'},
+                                        format='json')
+        self.assertEqual(response.status_code, 429)
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        location = Location.objects.create(latitude=56.8, longitude=60.6, address='Адрес')
+        Gym.objects.create(name='Gym', location=location)
+
+    def test_exposes_route_metrics(self):
+        self.client.get('/api/gyms/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        labels = 'route="gym-list",method="GET",status="200"'
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 1', body)
+        # залы, фотографии, участники (вложенные залы участников не грузятся — участников нет)
+        self.assertIn(f'http_request_db_queries_total{{{labels}}} 3', body)
+        self.assertIn(f'http_request_serialization_seconds_total{{{labels}}}', body)
+        self.assertNotIn('http_request_serialization_seconds_total{' + labels + '} 0.0\n', body)
+
+    @override_settings(METRICS_QUERY_BUDGETS={'gym-list': 2})
+    def test_warns_over_query_budget(self):
+        with self.assertLogs('main.metrics', level='WARNING') as logs:
+            self.client.get('/api/gyms/')
+        self.assertIn('бюджете 2', logs.output[0])
+
+    async def test_async_requests_are_not_adapted(self):
+        # Ни один middleware не переводит async-обработчик в поток
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', level='DEBUG'):
+            ASGIHandler()
+        response = await self.async_client.get('/api/async/gyms/')
+        self.assertEqual(response.status_code, 200)
+        body = registry.render()
+        self.assertIn('http_request_duration_seconds_count{route="async-gym-list",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_db_queries_total{route="async-gym-list",method="GET",status="200"} 3', body)
+
+    def test_restricted_to_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class DataGeneratorTests(APITestCase):
+    def test_generates_consistent_data(self):
+        result = generate(gyms=3, profiles=10, schedule=20, posters=5, memberships=2)
+        self.assertEqual(Gym.objects.count(), 3)
+        self.assertEqual(User.objects.filter(userprofile__isnull=False).count(), 10)
+        self.assertEqual(Schedule.objects.count(), 20)
+        gym = Gym.objects.get(slug=f"{result['prefix']}-gym-0")
+        self.assertEqual(gym.members_count, gym.users.count())
+        self.assertEqual(gym.members_count, gym.memberships.count())
+        self.assertEqual(gym.pictures.count(), 3)
+
+        response = self.client.post('/api/auth/login/', {'username': f"{result['prefix']}-user-1",
+                                                         'password': 'benchmark-password'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        poster = Poster.objects.first()
+        self.assertTrue(self.client.get('/api/blog/', {'q': poster.title.split()[0]}).data['results'])
@@ -0,0 +1,303 @@
+"""
+Загрузка изображений постеров и аватаров.
+
+Multipart-загрузки идут через StreamingImageUploadHandler: части файла сразу пишутся во временный
+файл и хэшируются (SHA-256) по мере чтения. Размер тела по Content-Length и размеры изображения
+по заголовку файла проверяются до того, как тело прочитано целиком.
+
+Сохранённые файлы называются по хэшу содержимого (posters/<sha256[:32]>.png), поэтому одинаковые
+картинки хранятся один раз, а media-сервер отдаёт их как неизменяемые (main.media.HASHED_NAME).
+
+Для нестабильных мобильных сетей есть возобновляемая загрузка по частям (модель Upload,
+/api/uploads/): клиент объявляет размер, отправляет части PATCH-запросами с заголовком Upload-Offset
+и после обрыва продолжает с offset из GET. Готовую загрузку передают вместо файла: picture=<id загрузки>.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException, ParseError, ValidationError
+
+from .models import Upload
+
+CHUNK_SIZE = 64 * 1024
+# Заголовок изображения (с EXIF) почти всегда укладывается в эти байты
+HEADER_BYTES = 256 * 1024
+
+
+def get_max_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+
+
+def get_max_dimension():
+    return getattr(settings, 'UPLOAD_MAX_DIMENSION', 8000)
+
+
+def get_chunk_max_size():
+    return getattr(settings, 'UPLOAD_CHUNK_MAX_SIZE', 5 * 1024 * 1024)
+
+
+def get_upload_dir():
+    directory = Path(getattr(settings, 'UPLOAD_RESUMABLE_DIR', Path(tempfile.gettempdir()) / 'resumable-uploads'))
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл слишком большой.'
+    default_code = 'upload_too_large'
+
+
+class OffsetConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'offset_conflict'
+
+    def __init__(self, offset):
+        super().__init__({'offset': offset})
+        self.offset = offset
+
+
+def too_large_message():
+    return f'Файл больше {get_max_size() // (1024 * 1024)} МБ.'
+
+
+def dimensions_error(field_name=None):
+    message = f'Изображение больше {get_max_dimension()} пикселей по стороне.'
+    return ValidationError({field_name: [message]} if field_name else [message])
+
+
+def check_dimensions(size, field_name=None):
+    if max(size) > get_max_dimension():
+        raise dimensions_error(field_name)
+
+
+def check_header(header, field_name=None):
+    """
+    Проверяет размеры изображения по началу файла. False — заголовок ещё не прочитан целиком
+    или это не изображение (тогда решит полная проверка ImageField).
+    """
+    # Image.open читает только заголовок и не выделяет память под пиксели
+    try:
+        with PILImage.open(BytesIO(header)) as image:
+            size = image.size
+    except PILImage.DecompressionBombError:
+        raise dimensions_error(field_name)
+    except Exception:
+        return False
+    check_dimensions(size, field_name)
+    return True
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class StreamingImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файл во временный файл, считает SHA-256 и прерывает загрузку при превышении лимитов."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Заявленный размер тела проверяется до чтения; запас — на текстовые поля формы
+        if content_length > get_max_size() + settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+            raise UploadTooLarge(too_large_message())
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.header = b''
+        self.header_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > get_max_size():
+            raise UploadTooLarge({self.field_name: [too_large_message()]})
+        self.digest.update(raw_data)
+        if not self.header_checked:
+            self.header += raw_data[:HEADER_BYTES - len(self.header)]
+            self.header_checked = check_header(self.header, self.field_name) or len(self.header) >= HEADER_BYTES
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        return file
+
+
+class StreamingUploadViewMixin:
+    """
+    Для DRF-view с MultiPartParser: файлы принимаются через StreamingImageUploadHandler,
+    а возобновляемые загрузки, переданные вместо файла, удаляются после коммита сохранения.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        request._request.upload_handlers = [StreamingImageUploadHandler(request._request)]
+        super().initial(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            super().perform_create(serializer)
+            consume_uploads(serializer)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            super().perform_update(serializer)
+            consume_uploads(serializer)
+
+
+def upload_path(upload):
+    return get_upload_dir() / f'{upload.pk}.part'
+
+
+class StoredUpload(File):
+    """Завершённая возобновляемая загрузка как файл: storage переносит её в media без копирования."""
+
+    def __init__(self, upload):
+        super().__init__(open(upload_path(upload), 'rb'), name=upload.filename)
+        self.sha256 = upload.sha256 or None
+        self.upload = upload
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class DeduplicatedImageField(serializers.ImageField):
+    """
+    ImageField, сохраняющий файл под именем из хэша содержимого. Если такое содержимое уже
+    есть в storage, возвращает имя существующего файла вместо повторной записи. Вместо файла
+    принимает id завершённой возобновляемой загрузки текущего пользователя; после сохранения
+    её удаляет consume_uploads, и повторно она не принимается.
+    """
+    default_error_messages = {
+        'upload': 'Загрузка не найдена, не завершена или уже использована.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, FieldFile):
+            # Уже сохранённый файл модели (обновление без новой картинки)
+            return super().to_internal_value(data)
+        if isinstance(data, str):
+            data = self.get_stored_upload(data)
+        file = super().to_internal_value(data)
+        image = getattr(file, 'image', None)
+        if image is not None:
+            check_dimensions(image.size)
+
+        digest = getattr(data, 'sha256', None) or content_hash(data)
+        extension = os.path.splitext(data.name)[1].lower()
+        name = f'{digest[:32]}{extension}'
+        model_field = self.parent.Meta.model._meta.get_field(self.source)
+        path = model_field.generate_filename(None, name)
+        # Валидация ничего не удаляет: загрузку забирает consume_uploads после сохранения
+        self.stored_upload = getattr(data, 'upload', None)
+        if model_field.storage.exists(path):
+            file.close()
+            return path
+        file.name = name
+        return file
+
+    def get_stored_upload(self, value):
+        request = self.context.get('request')
+        try:
+            upload = Upload.objects.get(pk=uuid.UUID(value), user_id=request.user.pk if request else None)
+        except (ValueError, Upload.DoesNotExist):
+            self.fail('upload')
+        if not upload.complete or not upload_path(upload).exists():
+            self.fail('upload')
+        return StoredUpload(upload)
+
+
+def consume_uploads(serializer):
+    """
+    Удаляет возобновляемые загрузки, использованные полями сериализатора, после коммита текущей
+    транзакции: при ошибке сохранения загрузка остаётся, и запрос можно повторить. Файл .part
+    к этому моменту уже перенесён в media (или не нужен — такое содержимое там было).
+    """
+    for field in serializer.fields.values():
+        upload = getattr(field, 'stored_upload', None)
+        if upload is not None:
+            transaction.on_commit(partial(remove_upload, upload))
+
+
+def read_body(stream, length, directory):
+    """Читает тело запроса порциями во временный файл рядом с загрузками и возвращает его путь."""
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.chunk', delete=False) as chunk:
+        remaining = length
+        while remaining > 0:
+            data = stream.read(min(CHUNK_SIZE, remaining)) if stream is not None else b''
+            if not data:
+                break
+            chunk.write(data)
+            remaining -= len(data)
+    if remaining:
+        os.unlink(chunk.name)
+        raise ParseError('Тело запроса короче Content-Length.')
+    return chunk.name
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Дописывает часть загрузки с позиции offset. Тело сначала читается во временный файл без
+    блокировок; затем в короткой транзакции offset сдвигается условным UPDATE (параллельная
+    часть с тем же offset получит 409) и часть дописывается в файл загрузки.
+    """
+    if length > get_chunk_max_size():
+        raise UploadTooLarge(f'Часть больше {get_chunk_max_size() // (1024 * 1024)} МБ.')
+    if offset + length > upload.size:
+        raise ValidationError({'offset': 'Часть выходит за объявленный размер файла.'})
+    if offset != upload.offset:
+        raise OffsetConflict(upload.offset)
+
+    chunk_path = read_body(stream, length, get_upload_dir())
+    try:
+        with transaction.atomic():
+            claimed = Upload.objects.filter(pk=upload.pk, offset=offset).update(
+                offset=offset + length, updated_at=timezone.now())
+            if not claimed:
+                raise OffsetConflict(Upload.objects.values_list('offset', flat=True).get(pk=upload.pk))
+            # Хвост от прерванной записи (offset в БД не сдвинулся) отбрасывается
+            fd = os.open(upload_path(upload), os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, 'r+b') as target, open(chunk_path, 'rb') as source:
+                target.truncate(offset)
+                target.seek(offset)
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+    finally:
+        os.unlink(chunk_path)
+    upload.offset = offset + length
+
+    if offset < HEADER_BYTES:
+        with open(upload_path(upload), 'rb') as file:
+            header = file.read(HEADER_BYTES)
+        try:
+            check_header(header)
+        except ValidationError:
+            remove_upload(upload)
+            raise
+    if upload.complete:
+        with open(upload_path(upload), 'rb') as file:
+            upload.sha256 = content_hash(file)
+        Upload.objects.filter(pk=upload.pk).update(sha256=upload.sha256)
+    return upload
+
+
+def remove_upload(upload):
+    upload_path(upload).unlink(missing_ok=True)
+    upload.delete()
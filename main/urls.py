@@ -1,11 +1,12 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import *
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
+from .views import AuthViewSet, GymViewSet, PosterViewSet, ProfileViewSet, ScheduleViewSet, UploadViewSet
 from django.conf import settings
-from django.conf.urls.static import static
+from . import async_views
+from .export import export_csv, export_ical
+from .media import serve_media
+from .metrics import metrics_view
+from .schema import openapi_schema, ui_view
 
 router = DefaultRouter()
 router.register(r'gyms', GymViewSet)
@@ -13,25 +14,25 @@ router.register(r'profiles', ProfileViewSet)
 router.register(r'blog', PosterViewSet)
 router.register(r'auth', AuthViewSet, basename='auth')
 router.register(r'schedule', ScheduleViewSet, basename='schedule')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 urlpatterns = [
-    path('api/', include(router.urls))
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="API Documentation",
-      default_version='v1',
-      description="API documentation for all available endpoints",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="contact@yourproject.com"),
-      license=openapi.License(name="BSD License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
-
-urlpatterns += [
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('api/async/blog/', async_views.poster_list, name='async-poster-list'),
+    path('api/async/blog/<int:pk>/', async_views.poster_detail, name='async-poster-detail'),
+    path('api/async/gyms/', async_views.gym_list, name='async-gym-list'),
+    path('api/async/gyms/<slug:slug>/', async_views.gym_detail, name='async-gym-detail'),
+    path('api/async/schedule/weekly/', async_views.weekly_schedule, name='async-schedule-weekly'),
+    path('api/schedule/export.csv', export_csv, name='schedule-export-csv'),
+    path('api/schedule/user/<int:key>.ics', export_ical, {'kind': 'user'}, name='schedule-user-ical'),
+    path('api/schedule/club/<slug:key>.ics', export_ical, {'kind': 'club'}, name='schedule-club-ical'),
+    path('api/', include(router.urls)),
+    path('metrics', metrics_view, name='metrics'),
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
 ]
+
+if getattr(settings, 'API_DOCS_ENABLED', True):
+    urlpatterns += [
+        path('openapi.json', openapi_schema, name='openapi-schema'),
+        path('swagger/', ui_view('swagger'), name='schema-swagger-ui'),
+        path('redoc/', ui_view('redoc'), name='schema-redoc'),
+    ]
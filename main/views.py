@@ -1,38 +1,136 @@
+import datetime
 import logging
+import re
+from functools import partial
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
 from django.http import JsonResponse
 from django.middleware.csrf import get_token
-from django.utils.timezone import localtime
+from django.shortcuts import get_object_or_404
+from django.utils.timezone import localdate, make_aware
 from django_filters.filters import NumberFilter
+from rest_framework.authtoken.models import Token
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.routers import DefaultRouter
 from rest_framework.views import APIView
-from rest_framework import viewsets, status, filters
+from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
+# Только декораторы и описания параметров (drf_yasg.utils, drf_yasg.openapi — несколько мс);
+# генератор, кодеки и рендереры схемы загружаются лениво в main.schema
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets
 from django_filters import FilterSet, CharFilter
+from . import hierarchy
+from .cache import cache_response
+from .geo import bounding_box, cells_for_box, haversine_km
+from .grid import empty_slots
+from .hashing import hash_password
+from .metrics import InstrumentedViewMixin, timed
+from .models import Gym, Poster, Schedule, Upload, UserProfile, WeeklyGrid
+from .pagination import PosterCursorPagination, PosterSearchPagination
 from .permission import IsStaff
-from .serializers import *
-from django_filters import FilterSet, CharFilter, UUIDFilter
-from rest_framework import filters
+from .scheduling import bulk_create_schedule, expand_recurrence
+from .search import search_posters
+from .serializers import (
+    CompactGymSerializer, CompactScheduleItemSerializer, CompactUserProfileSerializer,
+    CompactWeeklyGridScheduleSerializer, CompactWeeklyScheduleSerializer, GymSerializer,
+    HierarchyProfileSerializer, NearbyGymSerializer, PosterSearchSerializer, PosterSerializer,
+    ScheduleBulkSerializer, ScheduleItemSerializer, SyncScheduleItemSerializer, UserLoginSerializer,
+    UploadSerializer, UserProfileSerializer, UserRegistrationSerializer, UserSerializer, WeeklyScheduleSerializer,
+)
+from .shaping import DynamicFieldsViewMixin
+from .sync import SyncViewMixin
+from .uploads import OffsetConflict, StreamingUploadViewMixin, append_chunk, remove_upload
 logger = logging.getLogger(__name__)
 
-class GymViewSet(viewsets.ModelViewSet):
+POSTER_CACHE_MODELS = ('main.Poster',)
+GYM_CACHE_MODELS = ('main.Gym', 'main.Image', 'main.Location', 'main.UserProfile')
+SCHEDULE_CACHE_MODELS = ('main.Schedule',) + GYM_CACHE_MODELS
+
+class GymViewSet(SyncViewMixin, DynamicFieldsViewMixin, InstrumentedViewMixin, viewsets.ModelViewSet):
     queryset = Gym.objects.all()
     serializer_class = GymSerializer
+    sync_serializer_class = CompactGymSerializer
     lookup_field = 'slug'
     permission_classes = [AllowAny]
 
-class ProfileViewSet(viewsets.ModelViewSet):
-    queryset = UserProfile.objects.select_related('user').all()
+    @cache_response(*GYM_CACHE_MODELS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response(*GYM_CACHE_MODELS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_nearby_params(self, params):
+        errors = {}
+        values = {}
+        for name, default, low, high in (
+            ('lat', None, -90, 90),
+            ('lon', None, -180, 180),
+            ('radius', 10, 0, getattr(settings, 'NEARBY_MAX_RADIUS_KM', 100)),
+            ('limit', 20, 1, getattr(settings, 'API_MAX_PAGE_SIZE', 100)),
+        ):
+            raw = params.get(name, default)
+            try:
+                value = float(raw)
+            except (TypeError, ValueError):
+                errors[name] = 'Обязательный числовой параметр.'
+                continue
+            if not low <= value <= high:
+                errors[name] = f'Допустимый диапазон: {low}..{high}.'
+            values[name] = value
+        if errors:
+            raise ValidationError(errors)
+        values['limit'] = int(values['limit'])
+        return values
+
+    @action(detail=False, methods=['get'])
+    @cache_response(*GYM_CACHE_MODELS)
+    def nearby(self, request):
+        params = self.get_nearby_params(request.query_params)
+        lat, lon, radius = params['lat'], params['lon'], params['radius']
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+
+        # Сначала грубый отбор по ячейкам сетки и прямоугольнику (индекс), затем точное расстояние
+        candidates = Gym.objects.filter(
+            location__cell__in=cells_for_box(min_lat, max_lat, min_lon, max_lon),
+            location__latitude__range=(min_lat, max_lat),
+        ).select_related('location')
+        nearby = []
+        for gym in candidates:
+            gym.distance = haversine_km(lat, lon, gym.location.latitude, gym.location.longitude)
+            if gym.distance <= radius:
+                nearby.append(gym)
+        nearby.sort(key=lambda gym: gym.distance)
+        nearby = nearby[:params['limit']]
+
+        serializer = timed(NearbyGymSerializer(nearby, many=True, context=self.get_serializer_context(),
+                                               **self.get_shape()))
+        if 'pictures' in serializer.child.fields:
+            prefetch_related_objects(nearby, 'pictures')
+        return Response(serializer.data)
+
+class ProfileViewSet(StreamingUploadViewMixin, SyncViewMixin, DynamicFieldsViewMixin, InstrumentedViewMixin,
+                     viewsets.ModelViewSet):
+    queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
+    sync_serializer_class = CompactUserProfileSerializer
     permission_classes = [AllowAny]
     parser_classes = (MultiPartParser, FormParser)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # list/retrieve загружают user через setup_eager_loading по форме ответа, а update
+        # читает instance.user сам и отдаёт полный профиль
+        if self.action not in self.shaped_actions:
+            queryset = queryset.select_related('user')
+        return queryset
+
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter('username', openapi.IN_FORM, description="Username", type=openapi.TYPE_STRING),
@@ -58,20 +156,20 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
         user_serializer = UserSerializer(data=user_data)
         user_serializer.is_valid(raise_exception=True)
-        user = user_serializer.save()
-        user.set_password(user_data['password'])
-        user.save()
+        # Пароль хэшируется один раз, и строка пользователя пишется одним INSERT
+        user = user_serializer.save(password=hash_password(user_data['password']))
 
         profile_data = {
-            'user': user.id,
-            'avatar': request.FILES.get('avatar'),
+            # Файл или id завершённой возобновляемой загрузки (main.uploads)
+            'avatar': request.data.get('avatar') or None,
             'phone_number': request.data.get('phone_number'),
             'description': request.data.get('description'),
             'is_staff': request.data.get('is_staff'),
             'group_number': request.data.get('group_number')
         }
 
-        profile_serializer = self.get_serializer(data=profile_data)
+        # Профиль уже создан сигналом post_save для User — заполняем его
+        profile_serializer = self.get_serializer(user.userprofile, data=profile_data)
         profile_serializer.is_valid(raise_exception=True)
         self.perform_create(profile_serializer)
 
@@ -106,13 +204,12 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
         user_serializer = UserSerializer(instance.user, data=user_data, partial=partial)
         user_serializer.is_valid(raise_exception=True)
-        user = user_serializer.save()
-
         if 'password' in request.data:
-            user.set_password(request.data['password'])
-            user.save()
+            user_serializer.save(password=hash_password(request.data['password']))
+        else:
+            user_serializer.save()
 
-        avatar = request.FILES.get('avatar', instance.avatar if instance.avatar else None)
+        avatar = request.data.get('avatar') or (instance.avatar if instance.avatar else None)
 
         profile_data = {
             'avatar': avatar,
@@ -128,6 +225,44 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
         return Response(profile_serializer.data)
 
+    def get_hierarchy_depth(self, params):
+        max_depth = hierarchy.get_max_depth()
+        if 'depth' not in params:
+            return max_depth
+        try:
+            depth = int(params['depth'])
+        except ValueError:
+            raise ValidationError({'depth': 'Ожидается целое число.'})
+        if not 1 <= depth <= max_depth:
+            raise ValidationError({'depth': f'Допустимый диапазон: 1..{max_depth}.'})
+        return depth
+
+    def get_hierarchy(self, request, pk, direction):
+        # Обход на любую глубину — один рекурсивный запрос, затем профили одним запросом с prefetch
+        profile_id = get_object_or_404(UserProfile.objects.only('id'), pk=pk).id
+        nodes = hierarchy.walk(profile_id, direction, self.get_hierarchy_depth(request.query_params))
+        profiles = hierarchy.load_profiles(
+            nodes, HierarchyProfileSerializer.setup_eager_loading(UserProfile.objects.all()))
+        serializer = timed(HierarchyProfileSerializer(profiles, many=True, context=self.get_serializer_context()))
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    @cache_response('main.UserProfile')
+    def descendants(self, request, pk=None):
+        return self.get_hierarchy(request, pk, hierarchy.DOWN)
+
+    @action(detail=True, methods=['get'])
+    @cache_response('main.UserProfile')
+    def ancestors(self, request, pk=None):
+        return self.get_hierarchy(request, pk, hierarchy.UP)
+
+    @action(detail=True, methods=['get'])
+    @cache_response('main.UserProfile')
+    def subtree(self, request, pk=None):
+        profile_id = get_object_or_404(UserProfile.objects.only('id'), pk=pk).id
+        size, levels = hierarchy.subtree_size(profile_id, self.get_hierarchy_depth(request.query_params))
+        return Response({'profile': profile_id, 'descendants': size, 'levels': levels})
+
 
 def csrf(request):
     return JsonResponse({'csrfToken': get_token(request)})
@@ -237,22 +372,26 @@ class UserLoginAPIView(APIView):
 
 class PosterListView(APIView):
     permission_classes = [AllowAny]
+    pagination_class = PosterCursorPagination
 
+    @cache_response(*POSTER_CACHE_MODELS)
     def get(self, request):
-        posters = Poster.objects.all()
-        serializer = PosterSerializer(posters, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = self.pagination_class()
+        posters = paginator.paginate_queryset(Poster.objects.all(), request, view=self)
+        serializer = timed(PosterSerializer(posters, many=True))
+        return paginator.get_paginated_response(serializer.data)
 
 class PosterDetailView(APIView):
     permission_classes = [AllowAny]
 
+    @cache_response(*POSTER_CACHE_MODELS)
     def get(self, request, pk):
         try:
             poster = Poster.objects.get(pk=pk)
         except Poster.DoesNotExist:
             return Response({'error': 'Poster not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = PosterSerializer(poster)
+        serializer = timed(PosterSerializer(poster))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class ScheduleFilter(FilterSet):
@@ -263,23 +402,83 @@ class ScheduleFilter(FilterSet):
         model = Schedule
         fields = ['gym', 'user']
 
-class ScheduleViewSet(viewsets.ModelViewSet):
+class ScheduleViewSet(SyncViewMixin, DynamicFieldsViewMixin, InstrumentedViewMixin, viewsets.ModelViewSet):
     queryset = Schedule.objects.all()
     serializer_class = ScheduleItemSerializer
+    sync_serializer_class = SyncScheduleItemSerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend]
     filterset_class = ScheduleFilter
 
+    def get_week_range(self, value):
+        # week=2024-W19 (ISO-неделя) или week=2024-05-06 (дата начала), по умолчанию текущая неделя
+        if not value:
+            today = localdate()
+            start = today - datetime.timedelta(days=today.weekday())
+        else:
+            iso_week = re.fullmatch(r'(\d{4})-?W(\d{1,2})', value)
+            try:
+                if iso_week:
+                    start = datetime.date.fromisocalendar(int(iso_week[1]), int(iso_week[2]), 1)
+                else:
+                    start = datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ValidationError({'week': 'Ожидается ISO-неделя (2024-W19) или дата (2024-05-06).'})
+        end = start + datetime.timedelta(days=7)
+        return (
+            make_aware(datetime.datetime.combine(start, datetime.time.min)),
+            make_aware(datetime.datetime.combine(end, datetime.time.min)),
+        )
+
+    def get_weekly_queryset(self, queryset, week):
+        start, end = self.get_week_range(week)
+        # Диапазон по индексу (club/user, timestamp), день недели и час считаются в БД в текущей таймзоне
+        return queryset.filter(timestamp__gte=start, timestamp__lt=end).annotate(
+            weekday=ExtractIsoWeekDay('timestamp'),
+            hour=ExtractHour('timestamp'),
+        ).order_by('timestamp', 'id')
+
+    def get_grid_owner(self, params):
+        # Материализованная сетка есть только для одного клуба или одного тренера
+        if bool(params.get('gym')) == bool(params.get('user')):
+            return None
+        # Сетка хранится по ISO-неделям; неделя с другого дня (week=2024-05-08) собирается по расписанию
+        if self.get_week_range(params.get('week'))[0].weekday() != 0:
+            return None
+        if params.get('gym'):
+            return {'club__slug__iexact': params['gym']}
+        try:
+            return {'user_id': int(params['user'])}
+        except ValueError:
+            return None
+
+    def get_grid_schedule(self, owner, week, compact):
+        start, _ = self.get_week_range(week)
+        slots = WeeklyGrid.objects.filter(**owner, week_start=start.date()).values_list('slots', flat=True).first()
+        slots = slots or empty_slots()
+        events = [slot['event'] for day in slots.values() for slot in day.values() if slot['event']]
+        club_ids = {event['club'] for event in events}
+        user_ids = {event['user'] for event in events}
+        gym_serializer = CompactGymSerializer if compact else GymSerializer
+        user_serializer = CompactUserProfileSerializer if compact else UserProfileSerializer
+        clubs = {club.id: club for club in gym_serializer.setup_eager_loading(Gym.objects.filter(id__in=club_ids))}
+        users = {user.id: user for user in user_serializer.setup_eager_loading(
+            UserProfile.objects.filter(id__in=user_ids))}
+        if compact:
+            return {'schedule': slots, 'clubs': clubs, 'users': users}
+        for event in events:
+            event['club'] = clubs[event['club']]
+            event['user'] = users[event['user']]
+        return slots
+
     def get_weekly_schedule(self, queryset):
         days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
         schedule = {day: {} for day in days}
 
         for sched in queryset:
-            local_timestamp = localtime(sched.timestamp)
-            day_name = days[local_timestamp.weekday()]
-            hour = local_timestamp.hour
-            schedule[day_name][hour] = {
-                'time': hour,
+            day_name = days[sched.weekday - 1]
+            schedule[day_name][sched.hour] = {
+                'time': sched.hour,
                 'event': sched
             }
 
@@ -293,17 +492,66 @@ class ScheduleViewSet(viewsets.ModelViewSet):
 
         return schedule
 
+    def get_compact_weekly_schedule(self, queryset):
+        schedule = self.get_weekly_schedule(queryset)
+        club_ids = set()
+        user_ids = set()
+        for day in schedule.values():
+            for slot in day.values():
+                if slot['event'] is not None:
+                    club_ids.add(slot['event'].club_id)
+                    user_ids.add(slot['event'].user_id)
+
+        clubs = CompactGymSerializer.setup_eager_loading(Gym.objects.filter(id__in=club_ids))
+        users = CompactUserProfileSerializer.setup_eager_loading(UserProfile.objects.filter(id__in=user_ids))
+        return {
+            'schedule': schedule,
+            'clubs': {club.id: club for club in clubs},
+            'users': {user.id: user for user in users},
+        }
+
     @action(detail=False, methods=['get'])
+    @cache_response(*SCHEDULE_CACHE_MODELS,
+                    vary_on=lambda view, request: view.get_week_range(request.query_params.get('week'))[0].isoformat())
     def weekly(self, request):
-        queryset = self.filter_queryset(self.get_queryset())
+        compact = request.query_params.get('view') == 'compact'
+        owner = self.get_grid_owner(request.query_params)
+        if owner is not None:
+            schedule_data = self.get_grid_schedule(owner, request.query_params.get('week'), compact)
+            serializer_class = CompactWeeklyGridScheduleSerializer if compact else WeeklyScheduleSerializer
+            return Response(timed(serializer_class(schedule_data)).data)
+        serializer_class = CompactScheduleItemSerializer if compact else ScheduleItemSerializer
+        queryset = serializer_class.setup_eager_loading(self.filter_queryset(self.get_queryset()))
+        queryset = self.get_weekly_queryset(queryset, request.query_params.get('week'))
+        if compact:
+            schedule_data = self.get_compact_weekly_schedule(queryset)
+            serializer = timed(CompactWeeklyScheduleSerializer(schedule_data))
+            return Response(serializer.data)
         schedule_data = self.get_weekly_schedule(queryset)
-        serializer = WeeklyScheduleSerializer(schedule_data)
+        serializer = timed(WeeklyScheduleSerializer(schedule_data))
         return Response(serializer.data)
 
-class PosterViewSet(viewsets.ModelViewSet):
+    @swagger_auto_schema(method='post', request_body=ScheduleBulkSerializer)
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsStaff])
+    def bulk(self, request):
+        serializer = ScheduleBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if 'recurrence' in serializer.validated_data:
+            items = expand_recurrence(serializer.validated_data['recurrence'])
+        else:
+            items = serializer.validated_data['items']
+        created, errors = bulk_create_schedule(items)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': len(created)}, status=status.HTTP_201_CREATED)
+
+class PosterViewSet(StreamingUploadViewMixin, SyncViewMixin, DynamicFieldsViewMixin, InstrumentedViewMixin,
+                    viewsets.ModelViewSet):
     queryset = Poster.objects.all()
     serializer_class = PosterSerializer
+    sync_serializer_class = PosterSerializer
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = PosterCursorPagination
 
     def get_permissions(self):
         if self.action == 'create':
@@ -312,13 +560,77 @@ class PosterViewSet(viewsets.ModelViewSet):
             self.permission_classes = [AllowAny]
         return super().get_permissions()
 
-    def create(self, request, *args, **kwargs):
-        logger.info(f"Request headers: {request.headers}")
-        logger.info(f"Request data: {request.data}")
-        return super().create(request, *args, **kwargs)
-
-router = DefaultRouter()
-router.register(r'blog', PosterViewSet)
-router.register(r'gyms', GymViewSet)
-router.register(r'profiles', ProfileViewSet)
-router.register(r'schedule', ScheduleViewSet)
+    def perform_create(self, serializer):
+        # Только метаданные: тело запроса с файлом и заголовки с токеном в лог не пишутся
+        super().perform_create(serializer)
+        poster = serializer.instance
+        logger.info('Poster %s created by user %s: %s', poster.pk, self.request.user.pk, poster.picture.name)
+
+    @cache_response(*POSTER_CACHE_MODELS)
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if query:
+            return self.search(request, query)
+        return super().list(request, *args, **kwargs)
+
+    def search(self, request, query):
+        paginator = PosterSearchPagination()
+        posters = paginator.paginate_search(partial(search_posters, query), request)
+        serializer = timed(PosterSearchSerializer(posters, many=True, context=self.get_serializer_context(),
+                                                  **self.get_shape()))
+        return paginator.get_paginated_response(serializer.data)
+
+    @cache_response(*POSTER_CACHE_MODELS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class UploadViewSet(viewsets.GenericViewSet):
+    """
+    Возобновляемая загрузка по частям (main.uploads): POST объявляет имя и размер файла,
+    PATCH с заголовком Upload-Offset дописывает часть (тело — сырые байты), GET/HEAD
+    возвращает принятый offset, чтобы продолжить после обрыва.
+    """
+    # queryset класса — для типов параметров пути в схеме; выборка идёт через get_queryset
+    queryset = Upload.objects.all()
+    serializer_class = UploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        # drf_yasg строит схему без пользователя
+        if getattr(self, 'swagger_fake_view', False):
+            return Upload.objects.none()
+        return Upload.objects.filter(user=self.request.user)
+
+    def get_offset_headers(self, upload):
+        return {'Upload-Offset': str(upload.offset), 'Upload-Length': str(upload.size)}
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers={
+            'Location': request.build_absolute_uri(f'{upload.pk}/'), **self.get_offset_headers(upload)})
+
+    def retrieve(self, request, pk=None):
+        upload = self.get_object()
+        return Response(self.get_serializer(upload).data, headers=self.get_offset_headers(upload))
+
+    def partial_update(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            raise ParseError('Нужны заголовки Upload-Offset и Content-Length.')
+        # Тело не разбирается парсерами DRF: часть читается из потока порциями
+        try:
+            upload = append_chunk(upload, offset, request.stream, length)
+        except OffsetConflict as conflict:
+            return Response(conflict.detail, status=conflict.status_code,
+                            headers={'Upload-Offset': str(conflict.offset)})
+        return Response(self.get_serializer(upload).data, headers=self.get_offset_headers(upload))
+
+    def destroy(self, request, pk=None):
+        remove_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
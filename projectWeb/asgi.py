@@ -9,7 +9,12 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from main import startup
+
+# До импорта Django: профиль холодного старта при STARTUP_PROFILE=1 (main.startup)
+startup.install_from_env()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectWeb.settings')
 
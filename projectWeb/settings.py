@@ -46,14 +46,52 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'main.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.IdCursorPagination',
+    'PAGE_SIZE': 20,
 }
 
+# Верхняя граница ?page_size= для списочных эндпоинтов
+API_MAX_PAGE_SIZE = 100
+
+# Максимальный размер пакета POST /api/schedule/bulk/
+SCHEDULE_BULK_MAX_ITEMS = 5000
+
+# Максимальный радиус поиска /api/gyms/nearby/, км
+NEARBY_MAX_RADIUS_KM = 100
+
+# Размер порции строк при потоковой выгрузке расписания (main.export)
+SCHEDULE_EXPORT_CHUNK_SIZE = 2000
+
+# Инкрементальная синхронизация ?since= (main.sync): задержка выдачи свежих изменений, с
+# и срок хранения журнала удалений, дней (старые записи удаляет manage.py prune_tombstones)
+SYNC_SETTLE_SECONDS = 2
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+
+# Предел глубины обхода иерархии тренер -> ученик (main.hierarchy) и максимум для ?depth=
+HIERARCHY_MAX_DEPTH = 50
+
+# Страницы документации API (/openapi.json, /swagger/, /redoc/); API_DOCS_ENABLED=0 в окружении
+# отключает их на рабочих воркерах
+API_DOCS_ENABLED = os.environ.get('API_DOCS_ENABLED', '1') != '0'
+
+# OpenAPI-схема (main.schema) генерируется один раз на версию кода и хранится здесь;
+# API_SCHEMA_VERSION (например, git SHA из окружения) заменяет хэш исходников
+API_SCHEMA_DIR = BASE_DIR / 'schema'
+API_SCHEMA_VERSION = os.environ.get('API_SCHEMA_VERSION')
+SWAGGER_SETTINGS = {'SPEC_URL': 'openapi-schema'}
+REDOC_SETTINGS = {'SPEC_URL': 'openapi-schema'}
+
+# Кэш токенов в памяти процесса (main.authentication.CachedTokenAuthentication)
+TOKEN_CACHE_MAX_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
 MIDDLEWARE = [
+    'main.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -66,6 +104,16 @@ MIDDLEWARE = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Бюджет SQL-запросов на запрос (main.metrics): при превышении пишется предупреждение в лог.
+# METRICS_QUERY_BUDGETS переопределяет его для отдельных маршрутов по имени view, например 'gym-list'
+METRICS_QUERY_BUDGET = 20
+METRICS_QUERY_BUDGETS = {
+    'gym-list': 6,
+    'gym-detail': 6,
+}
+# Адреса и подсети, которым доступен /metrics (сборщик Prometheus)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 ROOT_URLCONF = 'projectWeb.urls'
 
 TEMPLATES = [
@@ -95,8 +143,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Соединение переиспользуется между запросами и проверяется перед повторным использованием
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Ожидание блокировки записи (с) вместо немедленной ошибки "database is locked";
+            # busy_timeout в SQLITE_PRAGMAS не задаётся, чтобы не перекрывать это значение
+            'timeout': 20,
+        },
+    }
+}
+
+# Применяются к каждому новому соединению SQLite (main.db). WAL позволяет читать во время записи
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache
+# Кэш ответов публичных эндпоинтов (main.cache). По умолчанию в памяти процесса с LRU-вытеснением;
+# при заданном DJANGO_CACHE_DIR — общий для всех воркеров файловый кэш. Версии для инвалидации
+# всегда в общем кэше (CACHES['versions']), поэтому ответы в памяти воркера не устаревают.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'projectweb',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+if os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'main.cache.LRUFileBasedCache',
+        'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 10},
     }
+
+# Версии моделей для ключей кэша ответов (main.cache) — общие для всех воркеров машины.
+# При нескольких машинах укажите здесь сетевой кэш (Redis)
+CACHES['versions'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.environ.get('DJANGO_VERSION_CACHE_DIR', BASE_DIR / 'cache' / 'versions'),
+    'OPTIONS': {'MAX_ENTRIES': 100000},
 }
+RESPONSE_VERSION_CACHE_ALIAS = 'versions'
+# manage.py test переносит CACHES['versions'] во временный каталог
+TEST_RUNNER = 'main.test_runner.TemporaryVersionCacheRunner'
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+# RESPONSE_CACHE_ENABLED=0 в окружении отключает кэш ответов и ETag (нагрузочные сравнения)
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', '1') != '0'
 
 
 # Password validation
@@ -118,6 +220,15 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Пул для хэширования паролей (main.hashing): число потоков (по умолчанию — число ядер)
+# и сколько запросов может ждать в очереди, прежде чем отвечать 429
+PASSWORD_HASHING_WORKERS = None
+PASSWORD_HASHING_QUEUE = None
+
+# Вход через django.contrib.auth.authenticate; пароль проверяется в пуле main.hashing
+AUTHENTICATION_BACKENDS = ['main.hashing.PooledModelBackend']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -139,6 +250,26 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Уменьшенные копии загруженных изображений (main.derivatives): ширины, размер пула воркеров
+# и сколько запущенных генераций помнит процесс
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 1280)
+IMAGE_DERIVATIVE_WORKERS = 2
+IMAGE_DERIVATIVE_SCHEDULED_MAX = 10000
+
+# Отдача /media/ (main.media): Cache-Control для файлов без хэша в имени и
+# перекладывание отдачи на веб-сервер: None, 'x-accel-redirect' (nginx) или 'x-sendfile'
+MEDIA_CACHE_MAX_AGE = 60 * 60
+MEDIA_OFFLOAD = os.environ.get('DJANGO_MEDIA_OFFLOAD') or None
+MEDIA_OFFLOAD_PREFIX = '/protected-media/'
+
+# Загрузки изображений (main.uploads): лимиты проверяются до чтения всего тела запроса;
+# возобновляемые загрузки копятся в UPLOAD_RESUMABLE_DIR и удаляются manage.py prune_uploads
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+UPLOAD_MAX_DIMENSION = 8000
+UPLOAD_CHUNK_MAX_SIZE = 5 * 1024 * 1024
+UPLOAD_RESUMABLE_DIR = BASE_DIR / 'uploads'
+UPLOAD_RESUMABLE_TTL_HOURS = 24
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field